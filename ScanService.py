@@ -4,15 +4,17 @@
 # @copyright: John Chen
 
 import socket
+import asyncio
 import threading
-from time import sleep
 from PySide6.QtCore import QObject, Signal, Slot
 
-# 导入 ADB 库
-from adb_shell.adb_device import AdbDeviceTcp
-
-# 默认的 ADB 端口
-ADB_PORT = 5555
+import adb_async
+import neighbor
+import CheckInput as Ck # 导入 CheckInput.py 模块
+import fingerprint
+from aioengine import get_engine
+from inventory import Inventory
+from scanner import Scanner, ScanTarget, ADB_PORT, DEFAULT_MAX_WORKERS, parse_targets, interleave, identity_matcher
 
 class ScanService(QObject):
     """
@@ -23,14 +25,33 @@ class ScanService(QObject):
     scan_finished = Signal(list)
     # device_found: 找到一个新设备时发送 (ip:port)
     device_found = Signal(str)
+    # device_lost: 清单中的设备复核后不再在线时发送 (ip:port)
+    device_lost = Signal(str)
     # log_signal: 用于发送扫描过程中的日志信息
     log_signal = Signal(str)
+    # scan_stats: 扫描完成时发送本次扫描的统计信息 (探测数、耗时、峰值并发)
+    scan_stats = Signal(dict)
+    # subnet_progress: 全量扫描中每个目标网段的进度 (网段, 已探测数, 总数)
+    subnet_progress = Signal(str, int, int)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, max_workers=DEFAULT_MAX_WORKERS, inventory=None):
         super().__init__(parent)
         self._is_running = False
         self._found_devices = []
-        self._threads = []
+        self.max_workers = max_workers
+        self.last_stats = None
+        self.inventory = inventory if inventory is not None else Inventory()
+        # 取消令牌：stop() 设置后正在进行的扫描尽快结束
+        self._cancel = threading.Event()
+
+    @property
+    def is_running(self):
+        return self._is_running
+
+    def stop(self):
+        """请求停止当前扫描 (可在任意线程调用)，socket 和握手在一个探测超时内释放。"""
+        if self._is_running:
+            self._cancel.set()
 
     def get_local_ip(self):
         """
@@ -49,79 +70,212 @@ class ScanService(QObject):
         return IP
 
     @Slot()
-    def scan_network(self, start_octet=1, end_octet=255):
+    def scan_network(self, start_octet=1, end_octet=255, full=False, targets=None, limit=None):
+        """
+        扫描入口 (在后台线程中执行)：
+        1. 清单中仍然新鲜的设备直接视为在线，已过期的设备优先重新探测；
+        2. 指定 full 或 targets，或清单为空、距上次全量扫描已久时，再做全量扫描。
+        targets: 扫描目标 (CIDR、地址范围、'all'，见 scanner.parse_targets)，
+                 为空时扫描本机所在网段的 start_octet-end_octet。
+        limit: 只要前 N 个设备，凑够后立即停止扫描。
+        """
+        self._run_exclusive(self._scan, start_octet, end_octet, full, targets, limit)
+
+    @Slot()
+    def find_device(self, target, targets=None, start_octet=1, end_octet=255):
         """
-        线程执行的入口：开始扫描局域网 IP。
+        按 MAC 或序列号查找单台设备 (在后台线程中执行)：
+        先验证清单和邻居表中的候选地址，未命中再扫描网段，找到即取消其余探测。
+        结果同样通过 device_found / scan_finished 发出，找到时列表中只有该设备。
         """
+        self._run_exclusive(self._find, target, targets, start_octet, end_octet)
+
+    def _run_exclusive(self, scan, *args):
         if self._is_running:
             self.log_signal.emit("扫描已在运行中...")
             return
 
         self._is_running = True
-        self._found_devices = []
-        self._threads = []
-        
-        local_ip = self.get_local_ip()
-        
+        self._cancel.clear()
+        # 扫描过程中确认在线的设备 (ip -> ip:port)；扫描出错时仍发出已找到的部分
+        found = {}
+        try:
+            scan(found, *args)
+            if self._cancel.is_set():
+                self.log_signal.emit("扫描已停止。")
+        except Exception as e:
+            self.log_signal.emit(f"扫描异常: {e!r}")
+        finally:
+            self._is_running = False
+            self._found_devices = list(found.values())
+            self.scan_finished.emit(self._found_devices)
+
+    def _targets(self, local_ip, start_octet, end_octet, targets):
+        """解析扫描目标，格式错误时输出日志并返回 None。"""
+        if targets:
+            try:
+                return parse_targets(targets, exclude={local_ip})
+            except ValueError as e:
+                self.log_signal.emit(f"扫描范围格式错误: {e}")
+                return None
+
         # 提取网段 (例如：从 '192.168.1.100' 得到 '192.168.1.')
         ip_parts = local_ip.split('.')
         if len(ip_parts) < 3:
-             self.log_signal.emit(f"错误：无法从 {local_ip} 解析网段。")
-             self.scan_finished.emit([])
-             return
+            self.log_signal.emit(f"错误：无法从 {local_ip} 解析网段。")
+            return None
 
         network_prefix = ".".join(ip_parts[:3]) + "."
+        hosts = [f"{network_prefix}{i}" for i in range(start_octet, end_octet + 1)]
+        return [ScanTarget(f"{network_prefix}{start_octet}-{end_octet}", [ip for ip in hosts if ip != local_ip])]
 
-        self.log_signal.emit(f"开始扫描网段: {network_prefix}1-{end_octet}...")
-
-        # 遍历网段内的所有 IP
-        for i in range(start_octet, end_octet + 1):
-            ip_to_check = f"{network_prefix}{i}"
-            # 跳过本机 IP 
-            if ip_to_check == local_ip:
-                continue
-                
-            # 为每个 IP 创建一个线程进行异步尝试连接
-            t = threading.Thread(target=self._check_adb_device, 
-                                 args=(ip_to_check, ADB_PORT))
-            self._threads.append(t)
-            t.start()
-
-        # 等待所有线程完成
-        # 注意：这里不能使用简单的 t.join()，否则会阻塞线程。
-        # 由于 Qt 信号机制的存在，我们只需要让主线程继续运行，并确保在退出时清理线程。
-        # 但由于这个方法是在 QThread 中执行的，我们需要等待所有子线程完成。
-        
-        # 使用一个循环等待所有工作线程完成
-        for t in self._threads:
-            # 设置一个合理的超时时间，防止单个连接卡死整个扫描流程的等待
-            t.join(timeout=1.0) 
-
-        # 再次检查是否有线程未完成，并强制等待它们，以确保结果完整
-        active_threads = [t for t in self._threads if t.is_alive()]
-        while active_threads:
-            sleep(0.1) # 短暂休眠
-            active_threads = [t for t in self._threads if t.is_alive()]
-            
-        
-        self.log_signal.emit(f"扫描完成，找到 {len(self._found_devices)} 个设备。")
-        self._is_running = False
-        self.scan_finished.emit(self._found_devices)
+    def _remaining(self, limit, found):
+        return None if limit is None else limit - len(found)
+
+    def _scan(self, found, start_octet, end_octet, full, targets, limit):
+        local_ip = self.get_local_ip()
+        scan_targets = self._targets(local_ip, start_octet, end_octet, targets)
+        if scan_targets is None:
+            return
+
+        scanner = Scanner(max_workers=self.max_workers, port=ADB_PORT)
 
-    def _check_adb_device(self, ip, port):
+        # 1. 复核清单中的设备
+        fresh, stale = self.inventory.partition()
+        for record in fresh[:limit]:
+            found[record.ip] = f"{record.ip}:{record.port}"
+            self.device_found.emit(found[record.ip])
+
+        if stale and self._remaining(limit, found) != 0:
+            self.log_signal.emit(f"复核清单中的 {len(stale)} 个设备...")
+            alive, stats = scanner.scan([r.ip for r in stale], on_found=self.device_found.emit,
+                                        limit=self._remaining(limit, found), cancel=self._cancel)
+            self._record(scanner, alive, found)
+            # 提前结束时未探测到的设备状态未知，保留在清单中
+            if not stats.stopped_early:
+                for record in stale:
+                    if record.ip not in found:
+                        self.inventory.drop(record.ip)
+                        self.device_lost.emit(f"{record.ip}:{record.port}")
+            self.log_signal.emit(f"复核完成，{stats}。")
+            self.last_stats = stats
+            self.scan_stats.emit(stats.as_dict())
+
+        # 2. 全量扫描 (按需或按计划；只要前 N 个时在数量不够时扫描)
+        if limit is not None:
+            need_sweep = len(found) < limit
+        else:
+            need_sweep = full or targets or self.inventory.full_scan_due()
+        if self._cancel.is_set():
+            pass # 已停止，不再全量扫描
+        elif need_sweep:
+            # 跳过已确认在线的设备
+            for target in scan_targets:
+                target.hosts = [ip for ip in target.hosts if ip not in found]
+            labels = ", ".join(t.label for t in scan_targets)
+            self.log_signal.emit(f"开始扫描: {labels} (并发上限 {self.max_workers})...")
+
+            # 各网段的地址交错排列，共享同一个并发预算；device_found 在本线程中逐个发出
+            new, stats = scanner.scan(interleave(scan_targets), on_found=self.device_found.emit,
+                                      on_progress=self._progress_reporter(scan_targets),
+                                      limit=self._remaining(limit, found), cancel=self._cancel)
+            self._record(scanner, new, found)
+            if not stats.stopped_early:
+                self.inventory.mark_full_scan()
+            self.log_signal.emit(f"扫描完成，{stats}。")
+            self.last_stats = stats
+            self.scan_stats.emit(stats.as_dict())
+        elif limit is not None:
+            self.log_signal.emit(f"设备清单中已有 {limit} 个在线设备，跳过扫描。")
+        else:
+            self.log_signal.emit("已使用设备清单，跳过全量扫描 (勾选“全网段”可强制扫描)。")
+
+        if not self._cancel.is_set():
+            self._fill_device_info(found)
+        self.inventory.save()
+
+    def _find(self, found, target, targets, start_octet, end_octet):
+        local_ip = self.get_local_ip()
+        scan_targets = self._targets(local_ip, start_octet, end_octet, targets)
+        if scan_targets is None:
+            return
+
+        scanner = Scanner(max_workers=self.max_workers, port=ADB_PORT)
+        match = identity_matcher(target)
+        mac = Ck.normalize_mac(target)
+
+        # 1. 候选地址：清单中记录的以及邻居表中该 MAC 对应的地址
+        candidates = [r.ip for r in self.inventory.find(mac=mac, serial=target.strip())]
+        if mac:
+            neighbor.table.refresh(max_age=1.0)
+            candidates += [ip for ip in neighbor.table.lookup_all(mac) if ip not in candidates]
+        if candidates:
+            self.log_signal.emit(f"验证 {target} 的候选地址: {', '.join(candidates)}")
+            hit, stats = scanner.scan(candidates, on_found=self.device_found.emit, match=match, limit=1,
+                                      cancel=self._cancel)
+            self._record(scanner, hit, found)
+            self.last_stats = stats
+
+        # 2. 扫描网段，找到即停止
+        if not found and not self._cancel.is_set():
+            for scan_target in scan_targets:
+                scan_target.hosts = [ip for ip in scan_target.hosts if ip not in candidates]
+            labels = ", ".join(t.label for t in scan_targets)
+            self.log_signal.emit(f"在 {labels} 中查找 {target}...")
+            hit, stats = scanner.scan(interleave(scan_targets), on_found=self.device_found.emit,
+                                      on_progress=self._progress_reporter(scan_targets), match=match, limit=1,
+                                      cancel=self._cancel)
+            self._record(scanner, hit, found)
+            self.log_signal.emit(f"查找结束，{stats}。")
+            self.last_stats = stats
+            self.scan_stats.emit(stats.as_dict())
+
+        if found:
+            self.log_signal.emit(f"已找到 {target}: {next(iter(found))}")
+            self._fill_device_info(found)
+        elif not self._cancel.is_set():
+            self.log_signal.emit(f"未找到 {target}。")
+        self.inventory.save()
+
+    def _progress_reporter(self, targets):
+        """返回 iter_sweep 的进度回调：按网段计数，每完成约 5% 或整个网段完成时发出 subnet_progress。"""
+        label_of = {ip: t.label for t in targets for ip in t.hosts}
+        totals = {t.label: len(t.hosts) for t in targets}
+        done = dict.fromkeys(totals, 0)
+        steps = {label: max(1, total // 20) for label, total in totals.items()}
+
+        def on_progress(ip, is_open):
+            label = label_of.get(ip)
+            if label is None:
+                return
+            done[label] += 1
+            if done[label] % steps[label] == 0 or done[label] == totals[label]:
+                self.subnet_progress.emit(label, done[label], totals[label])
+        return on_progress
+
+    def _record(self, scanner, devices, found):
+        """把本次确认在线的设备写入清单"""
+        for device_str in devices:
+            ip, port = device_str.split(':')
+            found[ip] = device_str
+            self.inventory.seen(ip, port, scanner.latencies.get(ip))
+
+    def _fill_device_info(self, found):
         """
-        尝试连接单个 IP，检查是否为 ADB 设备。
-        这是一个在子线程中运行的阻塞调用。
+        为本次扫描确认在线、缺少 MAC/序列号等信息且尚未读取过的设备读取一次设备指纹 (并发执行)，
+        同时存入指纹缓存，随后选中该设备时的前置检查无需再次连接。
+        读取成功的记录标记为已读取，序列号本来为空的设备不会在每次扫描时重复读取。
         """
-        try:
-            # 设置极短的连接超时 (例如 0.5 秒) 以快速跳过非活跃 IP
-            device = AdbDeviceTcp(ip, port, default_timeout_s=0.5) 
-            device.connect()
-            
-            # 连接成功即为 ADB 设备
-            device_str = f"{ip}:{port}"
-            self._found_devices.append(device_str)
-            self.device_found.emit(device_str)
-            
-        except Exception:
-            pass # 连接失败，不是 ADB 设备
+        records = (self.inventory.get(ip) for ip in found)
+        missing = [r for r in records if r is not None and not r.info_read and not (r.mac and r.serial)]
+        if not missing:
+            return
+
+        async def fetch_all():
+            return await asyncio.gather(*(adb_async.device_fingerprint(r.ip, r.port) for r in missing))
+
+        for record, info in zip(missing, get_engine().run(fetch_all())):
+            if info:
+                fingerprint.cache.store(record.ip, record.port, info)
+                info.pop('account')
+                self.inventory.seen(record.ip, record.port, info_read=True, **info)
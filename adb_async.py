@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+
+import time
+import socket
+import asyncio
+
+# 导入 ADB 异步库 (pip install adb-shell[async])
+from adb_shell.adb_device_async import AdbDeviceTcpAsync
+
+# 默认的 ADB 端口
+ADB_PORT = 5555
+
+# CNXN 握手使用的主机标识，只取一次，避免每次连接都调用 gethostname
+try:
+    _BANNER = socket.gethostname()
+except Exception:
+    _BANNER = 'unknown'
+
+# --- 连接 ---
+
+async def open_device(ip, port=ADB_PORT, timeout=5):
+    """
+    建立 ADB 连接并完成握手。
+    返回: 已连接的 AdbDeviceTcpAsync；失败时抛出异常。
+    """
+    device = AdbDeviceTcpAsync(ip, int(port), default_transport_timeout_s=timeout, banner=_BANNER)
+    try:
+        await asyncio.wait_for(device.connect(auth_timeout_s=timeout, read_timeout_s=timeout), timeout * 2)
+    except BaseException:
+        await close_device(device)
+        raise
+    return device
+
+
+async def close_device(device):
+    """关闭连接，忽略关闭过程中的异常。"""
+    try:
+        await device.close()
+    except Exception:
+        pass
+
+# --- 连接池 ---
+
+# 空闲多久的会话会被关闭 (秒)，以及空闲检查的间隔
+POOL_IDLE_TIMEOUT = 60
+POOL_SWEEP_INTERVAL = 15
+# 会话空闲超过该时间 (秒) 后，复用前先执行一条空命令确认连接仍然可用
+POOL_PROBE_AFTER = 10
+
+
+async def _session_alive(session, timeout):
+    """
+    只用 adb_shell 的公开接口检查会话能否复用：刚用过的直接复用 (执行失败时 run 会重新握手重试)，
+    空闲较久的先执行一条空命令，避免在已被设备关闭的连接上等待超时。
+    """
+    device = session.device
+    if device is None or not device.available:
+        return False
+    if time.monotonic() - session.last_used < POOL_PROBE_AFTER:
+        return True
+    try:
+        await asyncio.wait_for(device.shell("true", read_timeout_s=timeout, timeout_s=timeout), timeout)
+    except Exception:
+        return False
+    session.last_used = time.monotonic()
+    return True
+
+
+class _Session:
+    __slots__ = ('device', 'lock', 'last_used')
+
+    def __init__(self):
+        self.device = None
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class AdbPool:
+    """
+    按 (ip, port) 复用 ADB 会话的连接池，只在事件循环线程中使用。
+    同一设备的命令串行执行；会话失效时自动重连，空闲超时的会话由后台任务关闭。
+    """
+
+    def __init__(self, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._reaper = None
+
+    def _session(self, ip, port):
+        key = (ip, int(port))
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._sessions[key] = _Session()
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_idle())
+        return session
+
+    async def run(self, ip, port, action, timeout=5):
+        """
+        在池中的会话上执行 action(device)。
+        复用的会话执行失败时重新握手并重试一次；新建的会话失败则直接抛出异常。
+        """
+        session = self._session(ip, port)
+        async with session.lock:
+            for attempt in range(2):
+                reused = await _session_alive(session, timeout)
+                if not reused:
+                    await self._drop(session)
+                    session.device = await open_device(ip, port, timeout)
+                try:
+                    result = await action(session.device)
+                    session.last_used = time.monotonic()
+                    return result
+                except Exception:
+                    await self._drop(session)
+                    if not reused or attempt:
+                        raise
+
+    async def ensure(self, ip, port, timeout=5):
+        """确保存在可用会话 (必要时握手)，返回是否成功。"""
+        try:
+            return await self.run(ip, port, _noop, timeout)
+        except Exception:
+            return False
+
+    async def evict(self, ip, port):
+        """关闭并移除某个设备的会话 (设备重启或恢复出厂后调用)。"""
+        session = self._sessions.pop((ip, int(port)), None)
+        if session is not None:
+            await self._drop(session)
+
+    async def close_all(self):
+        """关闭所有会话并停止空闲回收任务 (退出前调用)。"""
+        for key in list(self._sessions):
+            await self.evict(*key)
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+
+    @staticmethod
+    async def _drop(session):
+        device, session.device = session.device, None
+        if device is not None:
+            await close_device(device)
+
+    async def _reap_idle(self):
+        """定期关闭空闲超时的会话，池为空时退出。"""
+        while self._sessions:
+            await asyncio.sleep(POOL_SWEEP_INTERVAL)
+            now = time.monotonic()
+            for key, session in list(self._sessions.items()):
+                if session.lock.locked() or now - session.last_used < self.idle_timeout:
+                    continue
+                if self._sessions.get(key) is session:
+                    del self._sessions[key]
+                await self._drop(session)
+
+
+async def _noop(device):
+    return True
+
+
+# 事件循环内共享的连接池
+pool = AdbPool()
+
+# --- 核心操作 ---
+
+async def check_adb_device(ip, port=ADB_PORT, timeout=0.5):
+    """
+    尝试连接单个 IP，检查是否为 ADB 设备。
+    返回: 握手成功则 True，否则 False。
+    """
+    try:
+        device = await open_device(ip, port, timeout)
+    except Exception:
+        return False
+    await close_device(device)
+    return True
+
+
+async def connect(ip, port=ADB_PORT, timeout=3):
+    """尝试连接到 ADB 设备 (会话保留在连接池中供后续命令复用)，返回是否成功。"""
+    return await pool.ensure(ip, port, timeout)
+
+
+async def shell(ip, port, command, timeout=5):
+    """
+    通过连接池在设备上执行一条 ADB Shell 命令。
+    返回: (成功布尔值, 命令输出字符串)
+    """
+    async def action(device):
+        return await device.shell(command, read_timeout_s=timeout, timeout_s=timeout)
+
+    try:
+        output = await pool.run(ip, port, action, timeout)
+        return True, output.strip()
+    except Exception as e:
+        return False, str(e)
+
+
+async def shell_sequence(ip, port, commands, timeout=5, cancel=None):
+    """
+    通过连接池依次执行多条命令。
+    commands: [(命令, 执行后等待秒数), ...]
+    cancel: 可选的 threading.Event，被设置后不再执行后续命令。
+    返回: 全部成功则 True，任一失败或被取消则 False。
+    """
+    for command, delay in commands:
+        if cancel is not None and cancel.is_set():
+            return False
+        success, _ = await shell(ip, port, command, timeout)
+        if not success:
+            return False
+        if delay:
+            await asyncio.sleep(delay)
+    return True
+
+
+# 一次 Shell 调用读取厂商、型号、有线网卡 MAC 和序列号。
+# 每项输出一行 @@<名称>=<值>，某项为空 (例如未设置序列号) 时其它项不会错位
+_INFO_MARK = '@@'
+_INFO_FIELDS = (
+    ('manufacturer', "getprop ro.product.manufacturer"),
+    ('model', "getprop ro.product.model"),
+    ('mac', "cat /sys/class/net/eth0/address 2>/dev/null"),
+    ('serial', "getprop ro.serialno"),
+)
+# 设备指纹在基本信息之外再读取 PPPoE 账号 (用于判断 OTTX 状态)
+_FINGERPRINT_FIELDS = _INFO_FIELDS + (('account', "skget skyworth.params.net.dhcpusr 2>/dev/null"),)
+
+
+def _info_command(fields):
+    return "; ".join(f'echo "{_INFO_MARK}{key}=$({command})"' for key, command in fields)
+
+
+_INFO_COMMAND = _info_command(_INFO_FIELDS)
+_FINGERPRINT_COMMAND = _info_command(_FINGERPRINT_FIELDS)
+
+
+def _parse_info(output, fields=_INFO_FIELDS):
+    """按标记取出各项的值，缺少的项为空字符串。"""
+    info = dict.fromkeys((key for key, _ in fields), "")
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith(_INFO_MARK):
+            continue
+        key, _, value = line[len(_INFO_MARK):].partition('=')
+        if key in info:
+            info[key] = value.strip()
+    info['mac'] = info['mac'].upper()
+    return info
+
+
+async def device_info(ip, port=ADB_PORT, timeout=3):
+    """
+    读取设备基本信息。
+    返回: {'manufacturer', 'model', 'mac', 'serial'} 字典，失败返回 None。
+    """
+    success, output = await shell(ip, port, _INFO_COMMAND, timeout)
+    if not success:
+        return None
+    return _parse_info(output)
+
+
+async def device_fingerprint(ip, port=ADB_PORT, timeout=3):
+    """
+    一次 Shell 调用读取设备指纹。
+    返回: {'manufacturer', 'model', 'mac', 'serial', 'account'} 字典，失败返回 None。
+    """
+    success, output = await shell(ip, port, _FINGERPRINT_COMMAND, timeout)
+    if not success:
+        return None
+    return _parse_info(output, _FINGERPRINT_FIELDS)
+
+
+async def reboot(ip, port=ADB_PORT, timeout=5):
+    """重启设备。连接失败返回 False；命令发出后设备断开是正常的。"""
+    async def action(device):
+        try:
+            await device.reboot(read_timeout_s=timeout, timeout_s=timeout)
+        except Exception:
+            pass # 重启命令发送后设备立即断开连接是正常的
+        return True
+
+    try:
+        return await pool.run(ip, port, action, timeout)
+    except Exception:
+        return False
+    finally:
+        await pool.evict(ip, port)
+
+
+async def recovery(ip, port=ADB_PORT):
+    """发送恢复出厂设置广播，之后该设备的会话不再可用。"""
+    success, _ = await shell(ip, port, "am broadcast -a android.intent.action.MASTER_CLEAR")
+    await pool.evict(ip, port)
+    return success
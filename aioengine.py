@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 同时执行的阻塞型流程 (例如一次完整的修改流程) 的上限
+DEFAULT_MAX_BLOCKING = 8
+
+
+class AsyncEngine:
+    """
+    在单个后台线程中运行 asyncio 事件循环。
+    所有网络 I/O 协程都提交到这个循环中并发执行，调用方通过 Future 获取结果；
+    需要顺序执行的阻塞流程则交给一个固定大小的线程池。
+    """
+
+    def __init__(self, max_blocking=DEFAULT_MAX_BLOCKING):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_blocking, thread_name_prefix='engine-task')
+        self._thread = threading.Thread(target=self._run_loop, name='engine-loop', daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop_thread(self):
+        """当前是否就在事件循环线程中。"""
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """提交协程，返回 concurrent.futures.Future (可在任意线程中等待或取消)。"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """提交协程并阻塞等待结果。不能在事件循环线程中调用，否则会死锁。"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("不能在事件循环线程中阻塞等待协程")
+        return self.submit(coro).result(timeout)
+
+    def submit_blocking(self, fn, *args, **kwargs):
+        """把阻塞函数交给引擎的线程池执行，返回 Future。"""
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        """停止事件循环和线程池。"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """获取进程内共享的 AsyncEngine (首次调用时创建)。"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncEngine()
+        return _engine
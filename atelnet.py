@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# asyncio Telnet 客户端：处理 IAC 选项协商，流式读取并按正则匹配提示符，代替已从标准库移除的 telnetlib。
+
+import re
+import asyncio
+
+# Telnet 命令 (RFC 854)
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+# 选项 (RFC 857 回显, RFC 858 抑制继续)
+ECHO = 1
+SGA = 3
+
+_IAC_BYTE = bytes([IAC])
+
+# 接受服务器开启的选项 (回显、抑制继续)；本端只同意抑制继续，其余一律拒绝
+ACCEPT_REMOTE = {ECHO, SGA}
+ACCEPT_LOCAL = {SGA}
+
+READ_SIZE = 4096
+
+
+class TelnetClient:
+    """
+    一个 Telnet 连接，只在事件循环线程中使用。
+    收到的数据去掉 IAC 协商后放入缓冲区，expect() 在缓冲区中匹配正则，
+    匹配成功即返回，未匹配时继续读取直到超时；同一个事件循环可以同时管理任意多个连接。
+    """
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.eof = False
+        self._buffer = bytearray()
+        # 数据块末尾未收完整的 IAC 序列
+        self._pending = b''
+        # 是否处于子协商 (IAC SB ... IAC SE) 中
+        self._sb = False
+        # 已回应过的选项状态，只在状态变化时回应，避免协商循环
+        self._options = {}
+
+    async def open(self, host, port=23, timeout=3):
+        """建立连接，超时抛出 asyncio.TimeoutError，连接失败抛出 OSError。"""
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+
+    async def write(self, data):
+        """发送数据 (数据中的 0xFF 按协议转义)。"""
+        self.writer.write(data.replace(_IAC_BYTE, _IAC_BYTE * 2))
+        await self.writer.drain()
+
+    async def expect(self, patterns, timeout=None):
+        """
+        读到 patterns (已编译的 bytes 正则列表) 中任意一个匹配为止，匹配按列表顺序检查。
+        返回: (序号, match, 截至匹配结尾的数据)；超时返回 (-1, None, 已读到的数据)。
+        连接已关闭且没有剩余数据时抛出 EOFError。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            # 在不可变的副本上匹配，返回的 match 不受之后缓冲区变化的影响
+            buffer = bytes(self._buffer)
+            for index, pattern in enumerate(patterns):
+                match = pattern.search(buffer)
+                if match:
+                    del self._buffer[:match.end()]
+                    return index, match, buffer[:match.end()]
+            if self.eof:
+                data = self._take()
+                if not data:
+                    raise EOFError('telnet connection closed')
+                return -1, None, data
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return -1, None, self._take()
+            await self._fill(remaining)
+
+    async def read_until(self, expected, timeout=None):
+        """读到 expected (bytes) 为止，超时返回已读到的数据。"""
+        _, _, data = await self.expect([re.compile(re.escape(expected))], timeout)
+        return data
+
+    async def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        self.writer = None
+
+    def _take(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    async def _fill(self, timeout):
+        """读取一个数据块放入缓冲区，超时直接返回。"""
+        try:
+            chunk = await asyncio.wait_for(self.reader.read(READ_SIZE), timeout)
+        except asyncio.TimeoutError:
+            return
+        except OSError:
+            chunk = b''
+        if not chunk:
+            self.eof = True
+            return
+        self._buffer += self._process(chunk)
+
+    def _process(self, chunk):
+        """去掉 IAC 命令并回应选项协商，返回普通数据。"""
+        data = self._pending + chunk
+        self._pending = b''
+        out = bytearray()
+        i, n = 0, len(data)
+        while i < n:
+            if self._sb:
+                # 子协商内容全部丢弃，直到 IAC SE
+                j = data.find(_IAC_BYTE, i)
+                if j < 0 or j + 1 >= n:
+                    if j >= 0:
+                        self._pending = data[j:]
+                    break
+                if data[j + 1] == SE:
+                    self._sb = False
+                i = j + 2
+                continue
+
+            j = data.find(_IAC_BYTE, i)
+            if j < 0:
+                out += data[i:]
+                break
+            out += data[i:j]
+            if j + 1 >= n:
+                self._pending = data[j:]
+                break
+            command = data[j + 1]
+            if command == IAC:
+                out.append(IAC)
+                i = j + 2
+            elif command in (DO, DONT, WILL, WONT):
+                if j + 2 >= n:
+                    self._pending = data[j:]
+                    break
+                self._negotiate(command, data[j + 2])
+                i = j + 3
+            elif command == SB:
+                self._sb = True
+                i = j + 2
+            else:
+                i = j + 2 # NOP、GA 等
+        # NVT 中回车后的 NUL 没有意义
+        return out.replace(b'\r\x00', b'\r')
+
+    def _negotiate(self, command, option):
+        if command in (WILL, WONT):
+            key = ('remote', option)
+            reply = DO if command == WILL and option in ACCEPT_REMOTE else DONT
+        else:
+            key = ('local', option)
+            reply = WILL if command == DO and option in ACCEPT_LOCAL else WONT
+        if self._options.get(key) == reply:
+            return
+        self._options[key] = reply
+        self.writer.write(bytes([IAC, reply, option]))
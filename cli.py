@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 无界面入口：命令行执行扫描、修改、重启、恢复出厂、批量清单、切换交换机 VLAN，以及监视目录的常驻模式 (不导入 Qt)。
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+
+import adb_async
+import workflow # 导入 workflow.py 模块
+import switchkeeper # 导入 switchkeeper.py 模块
+import CheckInput as Ck # 导入 CheckInput.py 模块
+from jobqueue import JobQueue, DEFAULT_MAX_PARALLEL, SUCCEEDED # 导入 jobqueue.py 模块
+from manifest import ManifestRunner # 导入 manifest.py 模块
+from inventory import Inventory # 导入 inventory.py 模块
+from scanner import Scanner, DEFAULT_MAX_WORKERS, parse_targets, interleave, identity_matcher, get_local_ip
+from aioengine import get_engine # 导入共享的异步引擎
+
+ADB_PORT = workflow.ADB_PORT
+
+# 常驻模式识别的清单文件后缀，以及结果文件后缀
+MANIFEST_SUFFIXES = ('.csv', '.tsv', '.txt')
+RESULT_SUFFIX = '.result.csv'
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INTERRUPTED = 130
+
+
+def log(msg):
+    """日志输出到标准错误，标准输出只留给结果 (便于脚本处理)"""
+    sys.stderr.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}\n")
+    sys.stderr.flush()
+
+
+def _wait(future, cancel):
+    """
+    等待后台任务结束。Ctrl+C 时设置取消令牌，再等待任务在当前步骤结束后退出。
+    返回: (结果, 是否被中断)
+    """
+    try:
+        return future.result(), False
+    except KeyboardInterrupt:
+        cancel.set()
+        log("正在停止，等待当前步骤结束...")
+        return future.result(), True
+
+
+def _parse_device(ip, mac):
+    """检查 IP 和 MAC 格式，返回解析好的 Mac，格式不正确时输出日志并返回 None。"""
+    if not Ck.check_ip(ip):
+        log("请输入正确的机顶盒IP地址。")
+        return None
+    parsed = Ck.Mac.parse(mac)
+    if parsed is None:
+        log("请检查机顶盒MAC地址是否正确。")
+    return parsed
+
+
+def _scan_targets(spec):
+    """解析 --targets，未给出时扫描本机所有网卡所在网段；格式错误时输出日志并返回 None。"""
+    try:
+        return parse_targets(spec or 'all', exclude={get_local_ip()})
+    except ValueError as e:
+        log(f"扫描范围格式错误: {e}")
+        return None
+
+
+def scan_devices(spec, port=ADB_PORT, limit=None, find=None, max_workers=DEFAULT_MAX_WORKERS, cancel=None):
+    """
+    扫描目标网段中的 ADB 设备，结果记入设备清单。
+    find: 按 MAC 或序列号查找单台设备 (找到即停止)。
+    返回: 设备列表 ['ip:port', ...]，目标格式错误时返回 None。
+    """
+    targets = _scan_targets(spec)
+    if targets is None:
+        return None
+
+    scanner = Scanner(max_workers=max_workers, port=port)
+    labels = ", ".join(t.label for t in targets)
+    if find:
+        log(f"在 {labels} 中查找 {find}...")
+        found, stats = scanner.scan(interleave(targets), match=identity_matcher(find), limit=1, cancel=cancel)
+    else:
+        log(f"开始扫描: {labels} (并发上限 {max_workers})...")
+        found, stats = scanner.scan(interleave(targets), on_found=lambda d: log(f"发现设备: {d}"),
+                                    limit=limit, cancel=cancel)
+    log(f"扫描完成，{stats}。")
+
+    inventory = Inventory()
+    for device in found:
+        ip, device_port = device.split(':')
+        inventory.seen(ip, device_port, scanner.latencies.get(ip))
+    if not stats.stopped_early and not find:
+        inventory.mark_full_scan()
+    inventory.save()
+    return found
+
+# --- 子命令 ---
+
+def cmd_scan(args):
+    cancel = threading.Event()
+    future = get_engine().submit_blocking(scan_devices, args.targets, args.port, args.limit, args.find,
+                                          args.workers, cancel)
+    found, interrupted = _wait(future, cancel)
+    if found is None:
+        return EXIT_FAILED
+    if args.json:
+        print(json.dumps(found))
+    else:
+        for device in found:
+            print(device)
+    if interrupted:
+        return EXIT_INTERRUPTED
+    return EXIT_OK if found or not args.find else EXIT_FAILED
+
+
+def _run_program(args, is_recovering, is_resetting):
+    mac = _parse_device(args.ip, args.mac)
+    if mac is None:
+        return EXIT_FAILED
+    if not get_engine().run(workflow.precheck(args.ip, log, args.port)):
+        return EXIT_FAILED
+
+    cancel = threading.Event()
+    kwargs = {'port': args.port, 'cancel': cancel, 'model': args.model}
+    if is_recovering:
+        kwargs['recovery_deadline'] = args.deadline
+    future = get_engine().submit_blocking(workflow.core_program, args.ip, mac, args.account,
+                                          is_recovering, is_resetting, log, **kwargs)
+    success, interrupted = _wait(future, cancel)
+    if interrupted:
+        return EXIT_INTERRUPTED
+    return EXIT_OK if success else EXIT_FAILED
+
+
+def cmd_change(args):
+    return _run_program(args, False, not args.no_reboot)
+
+
+def cmd_recovery(args):
+    return _run_program(args, True, True)
+
+
+def cmd_reboot(args):
+    if not Ck.check_ip(args.ip):
+        log("请输入正确的机顶盒IP地址。")
+        return EXIT_FAILED
+    cancel = threading.Event()
+    future = get_engine().submit_blocking(workflow.reboot_device, args.ip, log, args.port, cancel)
+    success, interrupted = _wait(future, cancel)
+    if interrupted:
+        return EXIT_INTERRUPTED
+    return EXIT_OK if success else EXIT_FAILED
+
+
+def cmd_switch(args):
+    to_ottx = None if args.to is None else args.to == 'ottx'
+    # 只切换一次时不需要保活
+    keeper = switchkeeper.SwitchKeeper(args.config, switchkeeper.KEEPALIVE_INTERVAL if args.keep else 0)
+    try:
+        success = workflow.toggle_vlan(log, to_ottx, keeper)
+        # 保持登录：之后每次切换只发送命令
+        while args.keep:
+            log("按回车再次切换，输入 q 退出：")
+            line = sys.stdin.readline()
+            if not line or line.strip().lower() == 'q':
+                break
+            success = workflow.toggle_vlan(log, None, keeper)
+    finally:
+        keeper.close()
+    return EXIT_OK if success else EXIT_FAILED
+
+
+def _job_queue(args):
+    def on_status(job):
+        if job.done:
+            log(f"[{job.ip}] 任务 #{job.job_id} {job.status}，耗时 {job.elapsed:.1f} 秒。")
+    return JobQueue(max_parallel=args.parallel, port=args.port, on_status=on_status,
+                    on_log=lambda job, msg: log(f"[{job.ip}] {msg}"))
+
+
+def _run_manifest(args, job_queue, path, stop):
+    """处理一个清单，返回各状态的行数统计；stop 被设置时停止读取后续行。"""
+    result_path = path.rsplit('.', 1)[0] + RESULT_SUFFIX
+    runner = ManifestRunner(job_queue, path, result_path, args.recovery, not args.no_reboot,
+                            device_timeout=args.device_timeout, log=log, model=args.model)
+    # 未指定 IP 的行依次使用 --devices 给出的设备和 --scan 扫描到的设备
+    for ip in (args.devices or "").replace(',', ' ').split():
+        runner.add_device(ip)
+    if args.scan:
+        for device in scan_devices(args.scan, args.port, cancel=stop) or []:
+            runner.add_device(device.split(':')[0])
+
+    log(f"开始处理清单: {path}，结果写入: {result_path}")
+    future = get_engine().submit_blocking(runner.run)
+    while not future.done():
+        if stop.wait(0.2):
+            runner.stop()
+            for job in list(job_queue.jobs.values()):
+                job_queue.cancel(job.job_id)
+            break
+    counts = future.result()
+    summary = "，".join(f"{status} {n} 行" for status, n in counts.items())
+    log(f"清单处理完成：{summary}。")
+    return counts
+
+
+def _failed(counts):
+    return any(n for status, n in counts.items() if status != SUCCEEDED)
+
+
+def cmd_batch(args):
+    if not os.path.exists(args.manifest):
+        log(f"清单文件不存在: {args.manifest}")
+        return EXIT_FAILED
+    job_queue = _job_queue(args)
+    stop = threading.Event()
+    future = get_engine().submit_blocking(_run_manifest, args, job_queue, args.manifest, stop)
+    try:
+        counts, interrupted = _wait(future, stop)
+    finally:
+        job_queue.shutdown()
+    if interrupted:
+        return EXIT_INTERRUPTED
+    return EXIT_FAILED if _failed(counts) else EXIT_OK
+
+
+def _pending_manifests(directory):
+    """目录中尚未生成结果文件的清单，按修改时间从旧到新"""
+    paths = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if (name.endswith(RESULT_SUFFIX) or not name.endswith(MANIFEST_SUFFIXES)
+                or os.path.exists(path.rsplit('.', 1)[0] + RESULT_SUFFIX)):
+            continue
+        paths.append(path)
+    return sorted(paths, key=os.path.getmtime)
+
+
+def daemon_loop(args, job_queue, stop):
+    """常驻循环：每隔 interval 秒检查监视目录，依次处理新放入的清单，直到 stop 被设置。"""
+    log(f"开始监视目录: {args.directory} (间隔 {args.interval} 秒)")
+    while not stop.is_set():
+        for path in _pending_manifests(args.directory):
+            if stop.is_set():
+                break
+            try:
+                _run_manifest(args, job_queue, path, stop)
+            except Exception as e:
+                log(f"清单处理异常 ({path}): {e}")
+        stop.wait(args.interval)
+    log("已停止监视。")
+
+
+def cmd_daemon(args):
+    if not os.path.isdir(args.directory):
+        log(f"目录不存在: {args.directory}")
+        return EXIT_FAILED
+    job_queue = _job_queue(args)
+    stop = threading.Event()
+    # 由服务管理器停止 (SIGTERM) 时与 Ctrl+C 一样结束
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    future = get_engine().submit_blocking(daemon_loop, args, job_queue, stop)
+    try:
+        _wait(future, stop)
+    finally:
+        job_queue.shutdown()
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="创维机顶盒串码修改工具 (命令行)")
+    parser.add_argument('--port', type=int, default=ADB_PORT, help="ADB 端口 (默认 %(default)s)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('scan', help="扫描局域网中的 ADB 设备")
+    p.add_argument('-t', '--targets', help="扫描目标: CIDR、地址范围或 all (逗号分隔，默认 all)")
+    p.add_argument('--limit', type=int, help="找到 N 个设备后停止")
+    p.add_argument('--find', metavar='MAC/SN', help="按 MAC 或序列号查找单台设备")
+    p.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS, help="握手并发上限 (默认 %(default)s)")
+    p.add_argument('--json', action='store_true', help="以 JSON 输出设备列表")
+    p.set_defaults(func=cmd_scan)
+
+    for name, func, text in (('change', cmd_change, "修改 MAC、SN 和账号 (默认改完重启)"),
+                             ('recovery', cmd_recovery, "修改后恢复出厂并自动拨号")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument('ip')
+        p.add_argument('mac')
+        p.add_argument('account')
+        p.add_argument('--model', help="选择串码模板的型号 (默认按设备型号)")
+        if name == 'change':
+            p.add_argument('--no-reboot', action='store_true', help="只修改，不重启")
+        else:
+            p.add_argument('--deadline', type=float, default=workflow.RECOVERY_DEADLINE,
+                           help="等待设备重新就绪的最长时间 (秒，默认 %(default)s)")
+        p.set_defaults(func=func)
+
+    p = sub.add_parser('reboot', help="单独重启设备")
+    p.add_argument('ip')
+    p.set_defaults(func=cmd_reboot)
+
+    p = sub.add_parser('switch', help="切换交换机 VLAN (配置文件中的全部交换机)")
+    p.add_argument('--to', choices=('ottx', 'network'), help="切换到 OTTX VLAN 或网络VLAN (默认按配置文件记录的下一次方向)")
+    p.add_argument('--config', default=switchkeeper.CONFIG_FILE, help="交换机配置文件 (默认 %(default)s)")
+    p.add_argument('--keep', action='store_true', help="保持登录，每按一次回车切换一次")
+    p.set_defaults(func=cmd_switch)
+
+    batch = sub.add_parser('batch', help="处理 CSV/TSV 清单")
+    batch.add_argument('manifest')
+    batch.set_defaults(func=cmd_batch)
+
+    daemon = sub.add_parser('daemon', help="常驻监视目录，处理放入的清单")
+    daemon.add_argument('directory')
+    daemon.add_argument('--interval', type=float, default=5.0, help="检查目录的间隔 (秒，默认 %(default)s)")
+    daemon.set_defaults(func=cmd_daemon)
+
+    for p in (batch, daemon):
+        p.add_argument('--parallel', type=int, default=DEFAULT_MAX_PARALLEL, help="并行数 (默认 %(default)s)")
+        p.add_argument('--recovery', action='store_true', help="修改后恢复出厂")
+        p.add_argument('--no-reboot', action='store_true', help="只修改，不重启")
+        p.add_argument('--model', help="选择串码模板的型号 (默认按设备型号)")
+        p.add_argument('--devices', help="供未填 IP 的行使用的设备 IP (逗号分隔)")
+        p.add_argument('--scan', metavar='TARGETS', help="处理前扫描这些目标，发现的设备供未填 IP 的行使用")
+        p.add_argument('--device-timeout', type=float, default=300, help="等待可用设备的最长时间 (秒)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    finally:
+        engine = get_engine()
+        # 关闭会话失败只记录，不覆盖命令本身的退出码
+        try:
+            engine.run(adb_async.pool.close_all(), timeout=5)
+        except Exception as e:
+            log(f"关闭 ADB 会话失败: {e!r}")
+        engine.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,43 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 # 用于切换华为交换机vlan
+import re
 import time
-import telnetlib
+import asyncio
 import os
 import json
 import logging
 from functools import wraps
 
+import atelnet # 导入 atelnet.py 模块
+from aioengine import get_engine # 导入共享的异步引擎
+
+# 华为交换机提示符：用户视图 <HUAWEI>，系统/VLAN/端口组视图 [HUAWEI]、[HUAWEI-vlan10]
+_PROMPT_LINE = r'(?<![^\r\n])[<\[][^\r\n<>\[\]]+[>\]]'
+_PROMPT = _PROMPT_LINE + r'\s*$'
+PROMPT_RE = re.compile(_PROMPT.encode())
+_PROMPT_TEXT_RE = re.compile(_PROMPT)
+# 输出较长时的分页提示，发送空格继续
+_MORE = r'-{2,} ?More ?-{2,}'
+MORE_RE = re.compile(_MORE.encode())
+_MORE_TEXT_RE = re.compile(_MORE)
+# 登录后的确认提问 (例如是否修改初始密码)
+CONFIRM_RE = re.compile(rb'\[Y/N\]:?\s*$')
+# 终端控制序列 (翻页后擦除 More 提示用)
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+
+# 单条命令等待提示符的最长时间 (秒)，登录等待的最长时间 (秒)
+COMMAND_TIMEOUT = 5
+LOGIN_TIMEOUT = 10
+# shutdown 与 undo shutdown 之间保持端口断开的时间 (秒)，让机顶盒感知到链路断开
+PORT_DOWN_HOLD = 1
+
+CONFIG_FILE = 'config.json'
+# 默认网络VLAN
+NETWORK_VID = "1"
+# 同时操作的交换机数上限
+MAX_PARALLEL_SWITCHES = 8
+
 # --- 全局日志配置控制 ---
 # 使用一个全局变量来确保文件日志配置只执行一次
 _FILE_LOG_CONFIGURED = False
@@ -44,10 +74,30 @@ class LogConfig:
         return logging.getLogger()
 
 
+class SwitchError(Exception):
+    """命令执行失败：交换机返回 Error:、等待提示符超时或连接中断。"""
+
+    def __init__(self, command, message, output="", results=None, failed=None):
+        super().__init__(f"{command}: {message}")
+        self.command = command
+        self.output = output
+        # 批量执行时：全部命令的 [(命令, 输出), ...] 与第一个出错命令的序号
+        self.results = results or []
+        self.failed = failed
+
+
 class TelnetLib(object):
+    """
+    华为交换机 Telnet 会话。网络 I/O 由 atelnet.TelnetClient 在共享事件循环中完成：
+    *_async 方法是协程，多台交换机的会话可以在同一个事件循环中同时进行；
+    同名的同步方法在事件循环中执行对应协程并等待结果。
+    """
 
     def __init__(self):
         self.tn = None
+        self.host = ""
+        # 最近一次读到的提示符，例如 [HUAWEI-vlan10]
+        self.prompt = ""
         self.EXIT = b'quit\n'
         self.LOGIN = b'Login'
         self.USERNAME = b'Username:'
@@ -59,44 +109,48 @@ class TelnetLib(object):
     def format(data):
         return data.encode('UTF-8') + b'\n'
 
-    def link(self, host, port=23, timeout=3):
+    async def link_async(self, host, port=23, timeout=3):
         # 连接设备
+        self.host = host
+        tn = atelnet.TelnetClient()
         try:
-            self.tn = telnetlib.Telnet(host, port, timeout)
+            await tn.open(host, port, timeout)
+            self.tn = tn
             self.logger.info(f'connect to {host}:{port} success')
             return True
         except Exception as e:
-            self.logger.warning(f'connect to {host}:{port} failed: {e}')
+            self.logger.warning(f'connect to {host}:{port} failed: {e!r}')
             print(f'连接到: {host} 端口: {port} 失败。')
             self.logger.warning('Please check the nework,IP address and Telnet Port enabled status.')
             print('请检查网络链接，IP地址是否正确，Telnet是否打开')
-            # 移除 start_switch() 的递归调用
-            input('按回车键返回主程序或退出...')
             return False
 
-    def login(self, username, password):
+    async def login_async(self, username, password, timeout=LOGIN_TIMEOUT):
         # 监听登录事件
         try:
-            self.tn.read_until(self.LOGIN, timeout=5)
+            await self.tn.read_until(self.LOGIN, timeout=5)
             # 监听输入账户事件
-            self.tn.read_until(self.USERNAME, timeout=5)
+            await self.tn.read_until(self.USERNAME, timeout=5)
         except EOFError:
              self.logger.error('Telnet connection closed unexpectedly before login prompt.')
              print('Telnet连接意外中断，无法到达登录提示。')
              return False
 
         # 输入账户
-        self.tn.write(self.format(username))
+        await self.tn.write(self.format(username))
         # 监听输入密码事件
-        self.tn.read_until(self.PASSWORD, timeout=5)
+        try:
+            await self.tn.read_until(self.PASSWORD, timeout=5)
+        except EOFError:
+            pass # 由下面的登录结果判断
         # 输入密码
-        self.tn.write(self.format(password))
-        time.sleep(2)
-        
-        command_result = self.tn.read_very_eager().decode('ascii', errors='ignore')
+        await self.tn.write(self.format(password))
+        # 等待提示符出现 (登录成功) 或再次要求输入账户 (登录失败)，不再固定等待
+        index, data = await self._expect_login(timeout)
+        command_result = data.decode('ascii', errors='ignore')
         
         # 统一处理登录失败的情况
-        if 'Error:' in command_result or 'Failure' in command_result:
+        if index != 0 or 'Error:' in command_result or 'Failure' in command_result:
             if 'Error: Failed to get domain policy' in command_result:
                 self.logger.error('Login failed: Failed to get domain policy')
                 print('用户名不正确')
@@ -109,30 +163,332 @@ class TelnetLib(object):
             elif 'Error: Failed to log in.' in command_result:
                 self.logger.error('Login failed: Failed to log in.')
                 print('登录失败，用户名或密码错误。请修改配置文件')
+            elif index == -1:
+                self.logger.error('Login failed: no prompt before timeout')
+                print('登录超时，交换机没有返回提示符。')
             else:
                  self.logger.error(f'Login failed with unspecific error: {command_result.strip()}')
                  print('登录失败，请检查用户名、密码或设备状态。')
             return False
         else:
+            self.prompt = _PROMPT_TEXT_RE.search(command_result).group().strip()
+            # 关闭本次会话的分页，否则批量写入时排在后面的命令会被当作翻页按键
+            await self.shell_async('screen-length 0 temporary', check=False)
             self.logger.info('login success.')
             print('登录成功')
             return True
 
-    def shell(self, command):
-        # 执行命令
-        self.tn.write(self.format(command))
-        # 延时0.5s
-        time.sleep(0.5) # 缩短延时，提高效率
-        # 在I/O不阻塞的情况下读取所有数据，否则返回空
-        data = self.tn.read_very_eager()
-        # 解码后返回数据
-        return data.decode('UTF-8', errors='ignore')
+    async def _expect_login(self, timeout):
+        """
+        读取登录结果，直到出现提示符 (0)、再次要求账户或密码 (1) 或超时 (-1)。
+        登录后的 [Y/N] 提问一律回答 N。返回: (结果, 读到的全部数据)
+        """
+        deadline = time.monotonic() + timeout
+        data = b''
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return -1, data
+            try:
+                index, _, chunk = await self.tn.expect(
+                    [PROMPT_RE, re.compile(self.USERNAME + b'|' + self.PASSWORD), CONFIRM_RE], remaining)
+            except EOFError:
+                return 1, data
+            data += chunk
+            if index != 2:
+                return index, data
+            await self.tn.write(self.format('N'))
 
-    def exit(self):
-        # 退出设备
-        self.tn.write(self.EXIT)
+    @staticmethod
+    def _prompt_re(next_command=None):
+        """
+        命令结束的标志：提示符出现在数据末尾。
+        批量执行时交换机在提示符后紧接着回显下一条命令，因此提示符后也可以是下一条命令。
+        """
+        if next_command is None:
+            return PROMPT_RE
+        return re.compile((_PROMPT_LINE + r'(?=\s*$|' + re.escape(next_command) + ')').encode())
+
+    async def _read_prompt(self, command, timeout, prompt_re=PROMPT_RE):
+        """读到下一个提示符为止 (自动翻过 More 分页)，返回读到的全部数据；超时或连接中断时抛出 SwitchError。"""
+        deadline = time.monotonic() + timeout
+        data = b''
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SwitchError(command, f'{timeout} 秒内没有返回提示符', data.decode('UTF-8', errors='ignore'))
+            try:
+                index, _, chunk = await self.tn.expect([prompt_re, MORE_RE], remaining)
+            except EOFError:
+                raise SwitchError(command, '连接已断开', data.decode('UTF-8', errors='ignore'))
+            data += chunk
+            if index == 0:
+                return data
+            if index == 1:
+                await self.tn.write(b' ')
+
+    async def shell_async(self, command, timeout=COMMAND_TIMEOUT, check=True):
+        """
+        执行命令，读到交换机返回提示符为止 (交换机一回应就返回，不再固定等待)。
+        返回: 命令输出 (不含回显和提示符)；check 为 True 时输出含 Error: 则抛出 SwitchError。
+        """
+        await self._send(self.format(command))
+        output = await self._read_output(command, timeout)
+        if check and self.ERROR.decode() in output:
+            self.logger.error(f'command "{command}" failed: {output}')
+            raise SwitchError(command, output, output)
+        return output
+
+    async def batch_async(self, commands, timeout=COMMAND_TIMEOUT, check=True):
+        """
+        整批命令一次写入 (一个网络往返)，再按提示符把返回的数据拆成每条命令的输出。
+        登录时已关闭分页，输出不会停在 More 处。
+        交换机按行执行已收到的命令，出错后已发出的命令无法撤回：check 为 True 时，
+        遇到第一个含 Error: 的输出后仍读完其余命令的输出以保持会话同步，然后抛出 SwitchError。
+        timeout: 每条命令等待提示符的时间。
+        返回: [(命令, 输出), ...]
+        """
+        commands = list(commands)
+        await self._send(b''.join(self.format(command) for command in commands))
+        results = []
+        failed = None
+        for i, command in enumerate(commands):
+            next_command = commands[i + 1] if i + 1 < len(commands) else None
+            output = await self._read_output(command, timeout, next_command)
+            results.append((command, output))
+            if failed is None and self.ERROR.decode() in output:
+                failed = i
+        if check and failed is not None:
+            command, output = results[failed]
+            skipped = len(commands) - failed - 1
+            self.logger.error(f'command "{command}" failed: {output} ({skipped} later commands already sent)')
+            raise SwitchError(command, output, output, results, failed)
+        return results
+
+    async def _send(self, data):
+        """发送命令，连接已断开时抛出 SwitchError"""
+        try:
+            await self.tn.write(data)
+        except (OSError, AttributeError) as e:
+            raise SwitchError(data.decode('UTF-8', errors='ignore').strip(), f'连接已断开 ({e!r})')
+
+    async def _read_output(self, command, timeout, next_command=None):
+        """读取一条命令的输出 (不含回显和提示符)，并记下新的提示符"""
+        data = await self._read_prompt(command, timeout, self._prompt_re(next_command))
+        text = _ANSI_RE.sub('', data.decode('UTF-8', errors='ignore'))
+        match = _PROMPT_TEXT_RE.search(text)
+        self.prompt = match.group().strip()
+        lines = _MORE_TEXT_RE.sub('', text[:match.start()]).splitlines()
+        # 第一行是命令回显
+        if lines and command in lines[0]:
+            lines = lines[1:]
+        return "\n".join(line.rstrip() for line in lines).strip()
+
+    async def exit_async(self):
+        # 退出设备 (连接已断开时只关闭)
+        if self.tn is None:
+            return
+        tn, self.tn = self.tn, None
+        try:
+            await tn.write(self.EXIT)
+        except (OSError, AttributeError):
+            pass
         # 关闭连接
-        self.tn.close()
+        await tn.close()
+
+    # --- 同步接口 (不能在事件循环线程中调用) ---
+
+    def link(self, host, port=23, timeout=3, interactive=True):
+        # interactive 为 False 时失败后不等待按回车，用于同时操作多台交换机
+        if _run(self.link_async(host, port, timeout)):
+            return True
+        # 移除 start_switch() 的递归调用
+        if interactive:
+            input('按回车键返回主程序或退出...')
+        return False
+
+    def login(self, username, password, timeout=LOGIN_TIMEOUT):
+        return _run(self.login_async(username, password, timeout))
+
+    def shell(self, command, timeout=COMMAND_TIMEOUT, check=True):
+        return _run(self.shell_async(command, timeout, check))
+
+    def batch(self, commands, timeout=COMMAND_TIMEOUT, check=True):
+        return _run(self.batch_async(commands, timeout, check))
+
+    def exit(self):
+        _run(self.exit_async())
+
+
+def _run(coro):
+    """在共享事件循环中执行协程并等待结果。"""
+    return get_engine().run(coro)
+
+
+async def switch_vlan_async(tl, vid, port_ranges):
+    """
+    把各端口范围加入 vlan，并通过端口组 ottx 关闭再打开这些端口，让机顶盒重新获取地址。
+    port_ranges: [(起始端口, 结束端口), ...]，例如 [('0/0/1', '0/0/24')]。
+    配置命令和 shutdown 一次写入；端口保持断开 PORT_DOWN_HOLD 秒后再一次写入 undo shutdown 和 return，
+    结束时回到用户视图，同一会话可以接着再次切换。
+    第一批出错时其余命令已经发出，若 shutdown 已执行则立即 undo shutdown 恢复端口，再抛出 SwitchError。
+    """
+    logger = LogConfig.getlogger()
+    tag = f'[{tl.host}] '
+    # (命令, 日志, 提示)
+    steps = [
+        ('system-view', 'switch to system-view', '切换到系统视图'),
+        (f'vlan {vid}', f'switch to vlan id {vid}', f'切换到vlan id {vid}'),
+    ]
+    for port_start, port_end in port_ranges:
+        steps.append((f'port Ethernet {port_start} to {port_end}', f'add port Ethernet {port_start} to {port_end} to vlan id {vid}',
+                      f'添加端口 Ethernet {port_start} 至 {port_end} 到 vlan id {vid}'))
+    steps += [
+        ('quit', None, None),
+        ('port-group ottx', 'create port-group ottx', '创建端口组ottx'),
+    ]
+    for port_start, port_end in port_ranges:
+        members = f'Ethernet {port_start} to Ethernet {port_end}'
+        steps.append((f'group-member {members}', f'group-member {members} to ottx',
+                      f'端口Ethernet {port_start} 至 Ethernet {port_end} 加入到组ottx'))
+    steps.append(('shutdown', 'shutdown port-group ottx', '关闭组内所有端口'))
+
+    try:
+        await tl.batch_async([command for command, _, _ in steps])
+    except SwitchError as e:
+        command, output = e.results[-1] if e.results else (e.command, e.output)
+        if command == 'shutdown' and tl.ERROR.decode() not in output:
+            await tl.shell_async(command='undo shutdown', check=False)
+            logger.warning(tag + 'restored port-group ottx after failed batch')
+        raise
+
+    for _, log_msg, print_msg in steps:
+        if log_msg:
+            logger.info(tag + log_msg)
+            print(tag + print_msg)
+
+    # shutdown 已在交换机返回提示符后生效，这里只保持端口断开一小段时间
+    await asyncio.sleep(PORT_DOWN_HOLD)
+
+    # 重新打开端口并回到用户视图
+    await tl.batch_async(['undo shutdown', 'return'])
+    logger.info(tag + 'activited port-group ottx')
+    print(tag + '重启组内所有端口')
+
+
+def port_ranges(config):
+    """
+    交换机配置中的端口范围 [(起始, 结束), ...]。
+    新格式为 port_ranges: [["0/0/1", "0/0/24"], ...]；旧格式的 port_start/port_end 视为一个范围。
+    """
+    if config.get('port_ranges'):
+        return [(str(start), str(end)) for start, end in config['port_ranges']]
+    return [(str(config['port_start']), str(config['port_end']))]
+
+
+def load_switches(path=CONFIG_FILE):
+    """读取配置文件中的全部交换机 (每台一个 dict)，格式错误时抛出 ValueError。"""
+    with open(path, 'r', encoding='utf8') as f:
+        data = json.loads(f.read())
+    if isinstance(data, dict):
+        data = [data]
+    if not data or not isinstance(data, list) or not all(isinstance(c, dict) for c in data):
+        raise ValueError('config.json file content format error.')
+    for config in data:
+        missing = [k for k in ('host_ip', 'username', 'password', 'OTTX_VID', 'vid') if k not in config]
+        if missing:
+            raise ValueError(f'switch config missing {", ".join(missing)}')
+        port_ranges(config)
+    return data
+
+
+def save_switches(switches, path=CONFIG_FILE):
+    with open(path, 'w', encoding='utf8') as w:
+        w.write(json.dumps(switches, sort_keys=True, indent=4, separators=(',', ': ')))
+
+
+class SwitchResult:
+    """一台交换机本次切换的结果"""
+
+    __slots__ = ('host', 'vid', 'success', 'connected', 'message', 'elapsed')
+
+    def __init__(self, host, vid, success=False, connected=True, message="", elapsed=0.0):
+        self.host = host
+        self.vid = vid
+        self.success = success
+        self.connected = connected
+        self.message = message
+        self.elapsed = elapsed
+
+    def __str__(self):
+        if self.success:
+            return f'{self.host}: 成功，已切换到 VLAN {self.vid} ({self.elapsed:.1f} 秒)'
+        return f'{self.host}: 失败，{self.message} ({self.elapsed:.1f} 秒)'
+
+
+async def toggle_switch_async(config, vid, timeout=3):
+    """登录一台交换机并把其端口切换到 vid，返回 SwitchResult (不抛出异常)。"""
+    logger = LogConfig.getlogger()
+    host = config['host_ip']
+    started = time.monotonic()
+    result = SwitchResult(host, vid)
+    tl = TelnetLib()
+    try:
+        if not await tl.link_async(host=host, port=int(config.get('port', 23)), timeout=timeout):
+            result.connected = False
+            result.message = '连接失败'
+        elif not await tl.login_async(username=config['username'], password=config['password']):
+            result.message = '登录失败'
+        else:
+            await switch_vlan_async(tl, vid, port_ranges(config))
+            result.success = True
+    except Exception as e:
+        logger.error(f"[{host}] Telnet command sequence failed: {e}")
+        result.message = f'执行 Telnet 命令序列时发生错误: {e}'
+    finally:
+        await tl.exit_async()
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+async def toggle_all_async(switches, vids, max_parallel=MAX_PARALLEL_SWITCHES):
+    """所有交换机的会话在同一个事件循环中同时进行，最多 max_parallel 台"""
+    slots = asyncio.Semaphore(max(1, max_parallel))
+
+    async def toggle(config, vid):
+        async with slots:
+            return await toggle_switch_async(config, vid)
+    return await asyncio.gather(*(toggle(c, v) for c, v in zip(switches, vids)))
+
+
+def toggle_targets(switches, to_ottx=None):
+    """
+    本次切换的方向和每台交换机的目标 VLAN。整个工作台切换到同一方向：
+    to_ottx 为 None 时按第一台交换机的 vid 判断本次切到 OTTX 还是网络VLAN。
+    返回: (是否切到 OTTX, [目标 vid, ...])
+    """
+    if to_ottx is None:
+        to_ottx = str(switches[0]['vid']) == str(switches[0]['OTTX_VID'])
+    return to_ottx, [str(c['OTTX_VID']) if to_ottx else NETWORK_VID for c in switches]
+
+
+def record_results(switches, results, to_ottx):
+    """成功的交换机把 vid 改为下一次要切换的 VLAN"""
+    for config, result in zip(switches, results):
+        if result.success:
+            config['vid'] = NETWORK_VID if to_ottx else str(config['OTTX_VID'])
+
+
+def toggle_all(switches, max_parallel=MAX_PARALLEL_SWITCHES, to_ottx=None):
+    """
+    同时切换所有交换机 (各自独立的 Telnet 会话，最多 max_parallel 台同时进行)，
+    总耗时约等于最慢的一台。方向见 toggle_targets。
+    成功的交换机把 vid 改为下一次要切换的 VLAN；返回 [SwitchResult, ...]，顺序与 switches 相同。
+    """
+    to_ottx, targets = toggle_targets(switches, to_ottx)
+    results = _run(toggle_all_async(switches, targets, max_parallel))
+    record_results(switches, results, to_ottx)
+    return results
 
 
 class Config:
@@ -144,21 +500,24 @@ class Config:
         print('配置文件不存在')
         print("创建配置文件")
         
-        # 强制要求输入有效值
-        host_ip = input("telnet IP:").strip()
-        username = input("用户名:").strip()
-        password = input("密码:").strip()
-        ottx_vid = input("OTTX_VID (目标VLAN ID):").strip()
-        port_start = input("起始端口 (如 0/0/1):").strip()
-        port_end = input("结束端口 (如 0/0/24):").strip()
-
-        datafile = open("config.json", 'w', encoding='utf-8')
-        
-        # 默认 vid 设置为 '1' (网络VLAN)
-        config = [{'host_ip': host_ip, 'username': username, 'password': password, 'OTTX_VID': ottx_vid, 'port_start': port_start, 'port_end': port_end, 'vid': '1'}]
-        datafile.write(json.dumps(config, sort_keys=True, indent=4, separators=(',', ': ')))
-        logger.info(f'config data written: {config}')
-        datafile.close()
+        switches = []
+        while True:
+            # 强制要求输入有效值
+            host_ip = input("telnet IP:").strip()
+            username = input("用户名:").strip()
+            password = input("密码:").strip()
+            ottx_vid = input("OTTX_VID (目标VLAN ID):").strip()
+            ranges = input("端口范围 (如 0/0/1-0/0/24，多个范围用逗号分隔):").strip()
+            port_ranges = [[x.strip() for x in r.split('-', 1)] for r in ranges.split(',') if '-' in r]
+
+            # 默认 vid 设置为 '1' (网络VLAN)
+            switches.append({'host_ip': host_ip, 'username': username, 'password': password, 'OTTX_VID': ottx_vid,
+                             'port_ranges': port_ranges, 'vid': NETWORK_VID})
+            if input("继续添加交换机? (y/N):").strip().lower() != 'y':
+                break
+
+        save_switches(switches)
+        logger.info(f'config data written: {[c["host_ip"] for c in switches]}')
 
 
 def start_switch():
@@ -166,132 +525,40 @@ def start_switch():
     LogConfig("file")
     logger = LogConfig.getlogger()
     
-    # 允许无限循环尝试（或直到成功/用户退出）
-    while True:
-        
-        # --- 2. 检查配置文件 ---
-        if os.path.exists("config.json"):
-            try:
-                with open('config.json', 'r', encoding='utf8') as f:
-                    data = json.loads(f.read())
-                
-                # 确保配置格式正确
-                if not data or not isinstance(data, list) or not isinstance(data[0], dict):
-                    logger.error("config.json file content format error.")
-                    print("配置文件内容格式错误，请删除后重新生成。")
-                    input("按回车继续")
-                    break
-                    
-                config = data[0]
-                
-                # 强制转换为字符串，确保在命令中安全使用
-                vid = str(config['vid'])
-                network = "1" # 默认网络VLAN
-                ottx = str(config['OTTX_VID'])
-                port_start = str(config['port_start'])
-                port_end = str(config['port_end'])
-                
-            except Exception as e:
-                logger.error(f"Failed to read or parse config.json: {e}")
-                print("读取或解析配置文件失败，请检查文件内容或权限。")
-                input("按回车继续")
-                break
-            
-            # --- 3. Telnet 连接和登录 ---
-            tl = TelnetLib()
-            if not tl.link(host=config['host_ip'], port=23, timeout=3):
-                # link失败，回到while循环开头，等待用户输入后重试
-                continue
-            
-            if not tl.login(username=config['username'], password=config['password']):
-                # login失败，退出程序
-                tl.exit()
-                break
+    # --- 2. 检查配置文件 ---
+    if not os.path.exists(CONFIG_FILE):
+        Config.setup()
+    if not os.access(CONFIG_FILE, os.W_OK):
+        logger.warning('配置文件不可写入,请检查权限设置')
+        print('配置文件不可写入,请检查权限设置')
+        return
 
-            # --- 4. 配置命令序列 ---
-            try:
-                # 切换到系统视图
-                tl.shell(command='system-view')
-                logger.info('switch to system-view')
-                print('切换到系统视图')
-                
-                # 配置VLAN ID
-                tl.shell(command=f'vlan {vid}')
-                logger.info(f'switch to vlan id {vid}')
-                print(f'切换到vlan id {vid}')
-                
-                # 将端口加入该VLAN
-                tl.shell(command=f'port Ethernet {port_start} to {port_end}')
-                logger.info(f'add port Ethernet {port_start} to {port_end} to vlan id {vid}')
-                print(f'添加端口 Ethernet {port_start} 至 {port_end} 到 vlan id {vid}')
-                
-                # 退出VLAN视图
-                tl.shell(command='quit')
-                
-                # 创建并配置端口组
-                tl.shell(command='port-group ottx')
-                logger.info('create port-group ottx')
-                print('创建端口组ottx')
-                
-                tl.shell(command=f'group-member Ethernet {port_start} to Ethernet {port_end}')
-                logger.info(f'group-member Ethernet {port_start} to Ethernet {port_end} to ottx')
-                print(f'端口Ethernet {port_start} 至 Ethernet {port_end} 加入到组ottx')
-                
-                # 重启端口组
-                tl.shell(command='shutdown')
-                logger.info(f'shutdown port-group ottx (Ethernet {port_start} to Ethernet {port_end})')
-                print('关闭组内所有端口')
-                
-                # 增加延时，确保端口关闭完成
-                time.sleep(1) 
-                
-                tl.shell(command='undo shutdown')
-                logger.info(f'activited port-group ottx (Ethernet {port_start} to Ethernet {port_end})')
-                print('重启组内所有端口')
-                
-                # 退出端口组视图
-                tl.shell(command='quit') 
-                
-                # 退出Telnet连接
-                tl.exit()
-
-                # --- 5. 更新配置文件并退出 ---
-                with open("config.json", 'w', encoding='utf8') as w:
-                    if vid == network:
-                        config['vid'] = ottx
-                        new_vid = ottx
-                    elif vid == ottx:
-                        config['vid'] = network
-                        new_vid = network
-                    else:
-                        # 如果 vid 既不是 network 也不是 ottx，则重置为 network
-                        config['vid'] = network
-                        new_vid = network
-                        logger.warning(f'current vid {vid} invalid, change config to default vlan {network}')
-
-                    logger.info(f'change configfile vid to {new_vid}')
-                    print(f"操作完成，下次运行将切换到VLAN ID: {new_vid}")
-                    
-                    config_list = [config] # 重新封装成列表
-                    w.write(json.dumps(config_list, sort_keys=True, indent=4, separators=(',', ': ')))
-                    
-                break # 成功完成操作，退出while循环
-                
-            except Exception as e:
-                logger.error(f"Telnet command sequence failed: {e}")
-                print(f"执行 Telnet 命令序列时发生错误: {e}")
-                tl.exit()
-                break # 命令执行失败，退出程序
-
-        # --- 6. 配置文件不存在或不可写 ---
-        elif not os.path.exists("config.json"):
-            Config.setup()
-            # setup完成后回到while循环开头，尝试读取新生成的配置
-            continue
-            
-        elif not os.access("config.json", os.W_OK):
-            logger.warning('配置文件不可写入,请检查权限设置')
-            print('配置文件不可写入,请检查权限设置')
+    try:
+        switches = load_switches()
+    except Exception as e:
+        logger.error(f"Failed to read or parse config.json: {e}")
+        print("读取或解析配置文件失败，请检查文件内容或权限。")
+        input("按回车继续")
+        return
+
+    # --- 3. 同时切换所有交换机；连接失败的可在确认网络后重试 ---
+    pending = switches
+    while pending:
+        started = time.monotonic()
+        results = toggle_all(pending)
+        # --- 4. 更新配置文件 (只有成功的交换机改为下一次的 VLAN) ---
+        save_switches(switches)
+
+        print(f'切换完成，用时 {time.monotonic() - started:.1f} 秒：')
+        for result in results:
+            (logger.info if result.success else logger.error)(f'switch {result}')
+            print(f'  交换机 {result}')
+        for config in switches:
+            logger.info(f'[{config["host_ip"]}] change configfile vid to {config["vid"]}')
+        print(f"下次运行将切换到VLAN ID: {', '.join(str(c['vid']) for c in switches)}")
+
+        pending = [c for c, r in zip(pending, results) if not r.connected]
+        if pending and input('按回车键重试连接失败的交换机，输入 q 退出：').strip().lower() == 'q':
             break
 
 # 主程序入口
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 设备指纹缓存：一次 Shell 调用读取厂商、型号、序列号、MAC 和 OTTX 状态，按设备缓存，供各项前置检查共用。
+
+import time
+import threading
+
+import adb_async
+from aioengine import get_engine
+
+ADB_PORT = adb_async.ADB_PORT
+
+# 指纹有效期 (秒)；设备重启、恢复出厂或写入参数后会被主动作废
+FINGERPRINT_TTL = 60
+
+# 创维机顶盒的厂商名
+SKYWORTH = "SKYWORTH"
+
+
+class Fingerprint:
+    """某一时刻读取到的设备信息。"""
+
+    __slots__ = ('ip', 'port', 'manufacturer', 'model', 'serial', 'mac', 'account', 'taken_at')
+
+    def __init__(self, ip, port, manufacturer="", model="", serial="", mac="", account=""):
+        self.ip = ip
+        self.port = int(port)
+        self.manufacturer = manufacturer
+        self.model = model
+        self.serial = serial
+        self.mac = mac
+        self.account = account
+        self.taken_at = time.monotonic()
+
+    @property
+    def ottx(self):
+        """PPPoE 账号已是 OTTX 账号 (xxxottx01@ottx)"""
+        return self.account.endswith("@ottx")
+
+    def is_manufacturer(self, name=SKYWORTH):
+        return self.manufacturer.strip().upper() == name.upper()
+
+
+class FingerprintCache:
+    """
+    按 (ip, port) 缓存的设备指纹，可在多个线程中使用。
+    缓存未命中或过期时通过共享的异步引擎读取一次；读取失败 (ADB 不可用) 不缓存。
+    """
+
+    def __init__(self, ttl=FINGERPRINT_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def cached(self, ip, port=ADB_PORT):
+        """返回未过期的指纹，没有则返回 None (不访问设备)。"""
+        key = (ip, int(port))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.taken_at > self.ttl:
+                del self._entries[key]
+                return None
+            return entry
+
+    def get(self, ip, port=ADB_PORT, refresh=False, timeout=3):
+        """
+        获取设备指纹，必要时读取设备 (阻塞，不能在事件循环线程中调用)。
+        refresh: 忽略缓存强制重新读取。
+        返回: Fingerprint；设备无法连接时返回 None。
+        """
+        if not refresh:
+            entry = self.cached(ip, port)
+            if entry is not None:
+                return entry
+        return get_engine().run(self.get_async(ip, port, True, timeout))
+
+    async def get_async(self, ip, port=ADB_PORT, refresh=False, timeout=3):
+        """get 的协程版本，在事件循环中执行。"""
+        if not refresh:
+            entry = self.cached(ip, port)
+            if entry is not None:
+                return entry
+        info = await adb_async.device_fingerprint(ip, port, timeout)
+        if info is None:
+            self.invalidate(ip, port)
+            return None
+        return self.store(ip, port, info)
+
+    def store(self, ip, port, info):
+        """保存一次读取结果 (info 为 adb_async.device_fingerprint 返回的字典)。"""
+        entry = Fingerprint(ip, port, **info)
+        with self._lock:
+            self._entries[(ip, int(port))] = entry
+        return entry
+
+    def invalidate(self, ip, port=None):
+        """作废某个设备的指纹；port 为 None 时作废该 IP 上的所有端口。"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == ip and (port is None or k[1] == int(port))]:
+                del self._entries[key]
+
+
+# 进程内共享的指纹缓存
+cache = FingerprintCache()
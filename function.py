@@ -5,64 +5,99 @@
 import os
 import re
 import time
+import shlex
 import socket
 from subprocess import getstatusoutput as gso
-from adb_shell.adb_device import AdbDeviceTcp
+
+import adb_async
+import neighbor
+import fingerprint
+import CheckInput as Ck # 导入 CheckInput.py 模块
+from aioengine import get_engine
 
 # 默认的 ADB 端口
 ADB_PORT = 5555
 
 # --- 辅助函数：核心 ADB 连接与执行 ---
+# 所有 ADB I/O 都在 AsyncEngine 的事件循环中执行，这里只是阻塞等待结果的同步外壳，
+# 供 Worker 等顺序流程调用（不能在事件循环线程中调用）。
+
+def _run(coro):
+    """在共享事件循环中执行协程并等待结果。"""
+    return get_engine().run(coro)
 
 def _execute_adb_shell(ip, port, command, timeout=5):
     """
     内部辅助函数：连接到设备并执行 ADB Shell 命令。
     返回: (成功布尔值, 命令输出字符串)
     """
-    try:
-        # 使用 AdbDeviceTcp 连接设备
-        device = AdbDeviceTcp(ip, int(port), default_timeout_s=timeout)
-        device.connect() # 假设不需要 RSA 密钥认证
-        
-        # 执行命令
-        output = device.shell(command)
-        
-        # 关闭连接，释放资源（adb_shell 会自动处理）
-        return True, output.strip()
-        
-    except Exception as e:
-        # 连接失败或命令执行失败
-        return False, str(e)
+    return _run(adb_async.shell(ip, port, command, timeout))
+
+# skset 批量执行时每条命令后输出的结束标记: @@SK<序号>:<退出码>
+_SKSET_MARK = '@@SK'
+_SKSET_MARK_RE = re.compile(r'^@@SK(\d+):(\d+)$')
+
+def skset_batch(ip, port, pairs, timeout=10):
+    """
+    在一次 Shell 往返中执行多条 skset。
+    pairs: [(key, value), ...]
+    返回: [(key, 成功布尔值, 该条命令的输出), ...]，顺序与 pairs 相同。
+    """
+    script = "; ".join(
+        f"skset {key} {shlex.quote(str(value))}; echo {_SKSET_MARK}{i}:$?"
+        for i, (key, value) in enumerate(pairs)
+    )
+    success, output = _execute_adb_shell(ip, port, script, timeout)
+    if not success:
+        return [(key, False, output) for key, _ in pairs]
+    # 参数已改变 (例如账号)，缓存的设备指纹不再可信
+    fingerprint.cache.invalidate(ip, port)
+    return _parse_skset_output(pairs, output)
+
+def _parse_skset_output(pairs, output):
+    """按结束标记把合并输出拆回每条 skset 的结果，缺少标记的视为失败。"""
+    status = {}
+    lines = []
+    for line in output.splitlines():
+        match = _SKSET_MARK_RE.match(line.strip())
+        if match is None:
+            lines.append(line)
+            continue
+        status[int(match.group(1))] = (match.group(2) == '0', "\n".join(lines).strip())
+        lines = []
+    return [(key,) + status.get(i, (False, "\n".join(lines).strip()))
+            for i, (key, _) in enumerate(pairs)]
+
+def _account_pairs(account):
+    """PPPoE 账号和密码对应的 skset 键值。"""
+    return [
+        ("skyworth.params.net.dhcpusr", f"{account}ottx01@ottx"),
+        ("skyworth.params.net.dhcppwd", "123456"),
+    ]
 
 # --- 工具函数 ---
 
-def sleep(seconds):
-    """使用标准 time.sleep 避免忙等待，释放 CPU 资源。"""
+def sleep(seconds, cancel=None):
+    """
+    等待指定秒数，不忙等待。
+    cancel 为 threading.Event 时可被提前打断，返回是否被取消。
+    """
+    if cancel is not None:
+        return cancel.wait(seconds)
     time.sleep(seconds)
+    return False
 
 def covert(mac):
     """
     判断mac地址格式并转化。
-    输入：支持 12位 (xxxxxxxxxxxx) 或 17位 (xx:xx:...) 格式。
+    输入：12位 (xxxxxxxxxxxx) 或 17位 (xx:xx:...) 格式的字符串，或已解析的 CheckInput.Mac。
     返回: (12位大写MAC, 冒号分隔MAC, 横线分隔小写MAC) 或 None
     """
-    mac = mac.strip().upper()
-    
-    # 清理分隔符
-    if len(mac) == 17:
-        if ':' in mac or '-' in mac:
-            mac = mac.replace(':', '').replace('-', '')
-    
-    # 检查长度和十六进制格式
-    if len(mac) != 12 or not re.fullmatch(r'[0-9A-F]{12}', mac):
+    # 规范化规则与输入校验共用；传入 Mac 时直接取其缓存的格式
+    mac = Ck.Mac.parse(mac)
+    if mac is None:
         return None
-
-    # 格式化
-    parts = re.findall('..', mac)
-    c_mac = ":".join(parts)  # 冒号分隔
-    m_mac = "-".join(parts).lower() # 横线分隔，小写
-    
-    return mac, c_mac, m_mac
+    return mac.forms
 
 # --- 核心业务函数（ADB 实现）---
 
@@ -71,20 +106,13 @@ def connect(ip, port=ADB_PORT):
     尝试连接到 ADB 设备。
     返回: 成功则 True，否则 False。
     """
-    try:
-        device = AdbDeviceTcp(ip, int(port), default_timeout_s=3)
-        device.connect()
-        return True
-    except Exception:
-        return False
+    return _run(adb_async.connect(ip, port, timeout=3))
 
 def recovery(ip, port=ADB_PORT):
     """发送恢复出厂设置广播"""
-    command = "am broadcast -a android.intent.action.MASTER_CLEAR"
-    success, info = _execute_adb_shell(ip, port, command)
-    
     # 假设设备成功收到广播即视为成功
-    return success
+    fingerprint.cache.invalidate(ip, port)
+    return _run(adb_async.recovery(ip, port))
 
 
 def kill():
@@ -102,93 +130,65 @@ def kill():
 
 def reboot(ip, port=ADB_PORT):
     """重启设备"""
-    try:
-        device = AdbDeviceTcp(ip, int(port), default_timeout_s=5)
-        device.connect()
-        # adb_shell 库的内置 reboot 命令
-        device.reboot() 
-        
-        # 重启命令发送后设备立即断开连接是正常的
-        return True 
-    except Exception:
-        # 如果是连接失败，则返回 False，否则（即命令发送成功后断开）返回 True
-        return True 
+    # 如果是连接失败，则返回 False，否则（即命令发送成功后断开）返回 True
+    fingerprint.cache.invalidate(ip, port)
+    return _run(adb_async.reboot(ip, port))
 
 
-def mac_change(mac, ip, port=ADB_PORT, sn_head=""):
-    """修改 MAC 和 SN 串码"""
+def mac_change(mac, ip, port=ADB_PORT, sn=""):
+    """修改 MAC 和 SN 串码 (sn 由 sngen 分配，为空时不写入，避免把设备 SN 清空)"""
     mac_data = covert(mac)
-    if mac_data is None:
+    if mac_data is None or not sn:
         return False
         
-    mac_12, c_mac, _ = mac_data
-    sn = sn_head + mac_12
+    _, c_mac, _ = mac_data
     
-    # 1. 修改 MAC
-    command_mac = f"skset mac {c_mac}"
-    success_mac, _ = _execute_adb_shell(ip, port, command_mac)
-    
-    if not success_mac:
-        return False
+    # MAC 和 SN 一次写入
+    results = skset_batch(ip, port, [("mac", c_mac), ("sn", sn)])
+    return all(success for _, success, _ in results)
 
-    # 2. 修改 SN
-    command_sn = f"skset sn {sn}"
-    success_sn, _ = _execute_adb_shell(ip, port, command_sn)
 
-    return success_sn
+def change_sn_account(ip, account, sn, port=ADB_PORT):
+    """
+    修改 SN 和 PPPoE 账号/密码 (sn 由 sngen 分配)。
+    参数与原来的 change(ip, mac, account, sn_head) 不同，因此改名，旧的调用会直接报错而不是写入错误的值。
+    """
+    if not sn:
+        return False
+    # SN、账号、密码一次写入
+    results = skset_batch(ip, port, [("sn", sn)] + _account_pairs(account))
+    return all(success for _, success, _ in results)
 
 
-def change(ip, mac, account, sn_head, port=ADB_PORT):
-    """修改 SN 和 PPPoE 账号/密码"""
+def provision(ip, mac, account, sn, port=ADB_PORT):
+    """
+    MAC、SN、账号、密码在一次 Shell 往返中全部写入。
+    返回: [(key, 成功布尔值, 输出), ...]；MAC 格式错误时返回 None。
+    """
     mac_data = covert(mac)
     if mac_data is None:
-        return False
-        
-    mac_12, c_mac, _ = mac_data
-    sn = sn_head + mac_12
-    
-    # 命令列表
-    commands = [
-        f"skset sn {sn}",
-        f"skset skyworth.params.net.dhcpusr {account}ottx01@ottx",
-        f"skset skyworth.params.net.dhcppwd 123456"
-    ]
-    
-    # 依次执行命令
-    for cmd in commands:
-        success, _ = _execute_adb_shell(ip, port, cmd)
-        if not success:
-            return False
-            
-    return True
+        return None
+
+    _, c_mac, _ = mac_data
+    return skset_batch(ip, port, [("mac", c_mac), ("sn", sn)] + _account_pairs(account))
 
 
-def auto_change(ip, account, port=ADB_PORT):
+def auto_change(ip, account, port=ADB_PORT, cancel=None):
     """
     通过模拟按键和 skset 命令进行自动拨号设置。
+    cancel: 可选的 threading.Event，被设置后不再发送后续按键。
     """
     # 确保连接状态
     if not connect(ip, port):
         return False
-        
-    try:
-        device = AdbDeviceTcp(ip, int(port), default_timeout_s=5)
-        device.connect()
-    except Exception:
-        return False
 
     # 1. 设置 PPPoE 账号和密码
-    commands_config = [
-        f"skset skyworth.params.net.dhcpusr {account}ottx01@ottx",
-        f"skset skyworth.params.net.dhcppwd 123456"
-    ]
-    for cmd in commands_config:
-        if not _execute_adb_shell(ip, port, cmd)[0]:
-            return False # 配置失败则退出
+    results = skset_batch(ip, port, _account_pairs(account))
+    if not all(success for _, success, _ in results):
+        return False # 配置失败则退出
 
-    # 2. 启动设置Activity (假设这是拨号设置界面)
-    device.shell("am start -n com.skyworth.modeselecter/com.skyworth.modeselecter.MainActivity")
-    time.sleep(1) # 等待应用启动
+    # 2. 启动设置Activity (假设这是拨号设置界面)，等待应用启动
+    ui_commands = [("am start -n com.skyworth.modeselecter/com.skyworth.modeselecter.MainActivity", 1)]
 
     # 3. 模拟按键操作
     key_commands = [
@@ -201,14 +201,13 @@ def auto_change(ip, account, port=ADB_PORT):
         "input keyevent KEYCODE_DPAD_CENTER",
         "input keyevent KEYCODE_DPAD_CENTER",
     ]
+    # 增加延迟以确保UI响应
+    ui_commands += [(cmd, 0.5) for cmd in key_commands]
 
-    for cmd in key_commands:
-        device.shell(cmd)
-        time.sleep(0.5) # 增加延迟以确保UI响应
-        
-    return True
+    # 在同一个连接中依次执行
+    return _run(adb_async.shell_sequence(ip, port, ui_commands, cancel=cancel))
 
-# --- 兼容 gso 的 ARP 查找逻辑 ---
+# --- ARP 查找逻辑 (见 neighbor.py) ---
 
 def get_local_ip_safe():
     """获取本机局域网 IP 地址的更健壮方法"""
@@ -222,48 +221,108 @@ def get_local_ip_safe():
         s.close()
     return IP
 
-def rec_auto_change(mac, account, port=ADB_PORT):
-    """恢复出厂后的自动拨号操作：通过 ARP 查找新 IP"""
+def local_subnet_hosts():
+    """本机所在 /24 网段内除本机外的所有地址"""
+    l_ip = get_local_ip_safe()
+    prefix = l_ip.rsplit('.', 1)[0]
+    return [f"{prefix}.{i}" for i in range(1, 255) if f"{prefix}.{i}" != l_ip]
+
+def find_ip_by_mac(mac, timeout=neighbor.RESOLVE_TIMEOUT, verify=None):
+    """
+    查找 MAC 对应的 IP：先查共享缓存和邻居表，未找到时向本机网段发送探测报文填充邻居表。
+    返回: IP 字符串，未找到返回 None。
+    """
     mac_data = covert(mac)
     if mac_data is None:
-        return False
-    
-    # mac_data[2] 是横线分隔的小写 MAC
-    _, _, m_mac = mac_data 
-    
-    l_ip = get_local_ip_safe()
-    
-    # 清空 ARP 缓存，确保获取最新的 IP-MAC 映射
-    # 此处依然依赖系统命令，无法用纯 Python ADB 替代
-    gso("arp -d") 
+        return None
+    return neighbor.resolver.resolve(mac_data[0], local_subnet_hosts(), timeout, verify)
 
-    # 查找 ARP 缓存 (此操作依赖于操作系统命令)
-    status, data = gso(f'arp -a -N {l_ip}')
-    
-    if status != 0:
-        return False 
-        
+# --- 恢复出厂后的就绪检测 ---
+
+# 默认的就绪等待总时长 (秒)，以及轮询间隔的初始值和上限
+READY_DEADLINE = 180
+READY_INITIAL_INTERVAL = 1
+READY_MAX_INTERVAL = 10
+# 等待设备在恢复出厂后先断开的最长时间 (秒)
+DOWN_TIMEOUT = 30
+
+def _port_open(ip, port, timeout=1):
+    """TCP 端口是否接受连接"""
     try:
-        # 尝试解码，Windows 下可能是 GBK
-        decoded_data = data.decode("gbk", errors='ignore') 
-    except (UnicodeDecodeError, AttributeError):
-        decoded_data = data.decode("utf-8", errors='ignore') 
-    
-    # 正则表达式匹配 IP 和 MAC
-    arp_regex = r'([0-9.]+)\s+([0-9a-f]{2}[-:][0-9a-f]{2}[-:][0-9a-f]{2}[-:][0-9a-f]{2}[-:][0-9a-f]{2}[-:][0-9a-f]{2})'
+        socket.create_connection((ip, int(port)), timeout=timeout).close()
+        return True
+    except OSError:
+        return False
 
-    found_new_ip = None
-    for arp_match in re.findall(arp_regex, decoded_data, re.IGNORECASE):
-        ip, found_mac = arp_match
-        current_mac = found_mac.lower().replace(':', '-')
-        
-        # 匹配到目标 MAC
-        if m_mac == current_mac:
-            found_new_ip = ip
-            break
+def _boot_completed(ip, port):
+    """设备 sys.boot_completed 是否已置 1"""
+    success, output = _execute_adb_shell(ip, port, "getprop sys.boot_completed")
+    return success and output.strip() == "1"
+
+def wait_until_ready(mac, old_ip=None, port=ADB_PORT, deadline=READY_DEADLINE, cancel=None, log=None):
+    """
+    恢复出厂后等待设备重新可用，替代固定的等待时间：
+    1. 若给出 old_ip，先等待设备断开 (最多 DOWN_TIMEOUT 秒)，避免把重启前的系统当作已就绪；
+    2. 按指数退避轮询：MAC 重新出现在邻居表中 (主动探测网段)、ADB 端口接受连接、sys.boot_completed 为 1。
+    返回: 设备就绪后的新 IP；超过 deadline 或被取消返回 None。
+    """
+    log = log or (lambda msg: None)
+    end = time.monotonic() + deadline
+    mac = Ck.Mac.parse(mac)
+    if mac is None:
+        return None
+
+    # 1. 等待设备断开
+    if old_ip:
+        down_end = min(end, time.monotonic() + DOWN_TIMEOUT)
+        while _port_open(old_ip, port) and time.monotonic() < down_end:
+            if sleep(0.5, cancel):
+                return None
+
+    # 设备会重新获取地址，旧的 MAC->IP 缓存不再可信
+    neighbor.resolver.forget(mac.hex)
+
+    # 2. 指数退避轮询，直到设备就绪
+    interval = READY_INITIAL_INTERVAL
+    stage = None
+    while time.monotonic() < end:
+        # 主动探测网段，只接受 ADB 端口已开放的地址
+        ip = find_ip_by_mac(mac, timeout=min(2, max(0, end - time.monotonic())),
+                            verify=lambda c: _port_open(c, port))
+        if ip is None:
+            ip = neighbor.table.lookup(mac.hex)
+
+        if ip is None:
+            current = "等待设备 MAC 出现在邻居表中..."
+        elif not _port_open(ip, port):
+            current = f"设备 IP 为 {ip}，等待 ADB 端口开放..."
+        elif not _boot_completed(ip, port):
+            current = f"设备 {ip} ADB 已连接，等待系统启动完成..."
+        else:
+            # 新地址上可能缓存着其它设备的指纹
+            fingerprint.cache.invalidate(ip, port)
+            return ip
+
+        if current != stage:
+            stage = current
+            log(current)
+
+        if sleep(min(interval, max(0, end - time.monotonic())), cancel):
+            return None
+        interval = min(interval * 2, READY_MAX_INTERVAL)
+
+    return None
+
+def rec_auto_change(mac, account, port=ADB_PORT, ip=None, cancel=None):
+    """
+    恢复出厂后的自动拨号操作。
+    ip: 已知的新 IP (例如 wait_until_ready 的结果)；未给出时主动解析 MAC 查找。
+    """
+    if ip is None:
+        ip = find_ip_by_mac(mac)
 
-    if found_new_ip:
+    if ip:
         # 找到新 IP 后，调用 auto_change 
-        return auto_change(found_new_ip, account, port)
+        return auto_change(ip, account, port, cancel)
 
     return False
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 设备清单缓存：记录扫描发现过的设备，后续扫描先复核已知设备，全量扫描只在需要时执行。
+
+import os
+import json
+import time
+import threading
+
+INVENTORY_FILE = 'devices.json'
+
+# 超过该时间 (秒) 未确认在线的设备需要重新探测
+STALE_AFTER = 120
+# 距上次全量扫描超过该时间 (秒) 时自动执行全量扫描
+FULL_SCAN_INTERVAL = 30 * 60
+
+
+class DeviceRecord:
+    """清单中的一台设备。info_read 表示已读取过设备信息 (序列号可能本来就为空，不再重复读取)。"""
+
+    __slots__ = ('ip', 'port', 'mac', 'serial', 'manufacturer', 'model', 'last_seen', 'latency', 'info_read')
+
+    def __init__(self, ip, port, mac="", serial="", manufacturer="", model="", last_seen=0.0, latency=None,
+                 info_read=False):
+        self.ip = ip
+        self.port = int(port)
+        self.mac = mac
+        self.serial = serial
+        self.manufacturer = manufacturer
+        self.model = model
+        self.last_seen = last_seen
+        self.latency = latency
+        self.info_read = info_read
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: data[k] for k in cls.__slots__ if k in data})
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def is_stale(self, max_age=STALE_AFTER, now=None):
+        return (now or time.time()) - self.last_seen > max_age
+
+
+class Inventory:
+    """
+    保存在 JSON 文件中的设备清单，按 IP 索引，可在多个线程中使用。
+    """
+
+    def __init__(self, path=INVENTORY_FILE):
+        self.path = path
+        self.last_full_scan = 0.0
+        self._devices = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """读取清单文件；文件不存在或损坏时从空清单开始。"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf8') as f:
+                data = json.loads(f.read())
+            devices = {d['ip']: DeviceRecord.from_dict(d) for d in data.get('devices', [])}
+        except Exception:
+            return
+        with self._lock:
+            self._devices = devices
+            self.last_full_scan = data.get('last_full_scan', 0.0)
+
+    def save(self):
+        """先写临时文件再替换，避免中途退出导致文件损坏。"""
+        with self._lock:
+            data = {
+                'last_full_scan': self.last_full_scan,
+                'devices': [r.as_dict() for r in self._devices.values()],
+            }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, sort_keys=True, indent=4, separators=(',', ': ')))
+        os.replace(tmp_path, self.path)
+
+    def devices(self):
+        """按最近在线时间从新到旧返回所有设备。"""
+        with self._lock:
+            records = list(self._devices.values())
+        return sorted(records, key=lambda r: r.last_seen, reverse=True)
+
+    def get(self, ip):
+        with self._lock:
+            return self._devices.get(ip)
+
+    def partition(self, max_age=STALE_AFTER):
+        """把设备分为 (仍然新鲜, 需要复核) 两组。"""
+        now = time.time()
+        fresh, stale = [], []
+        for record in self.devices():
+            (stale if record.is_stale(max_age, now) else fresh).append(record)
+        return fresh, stale
+
+    def seen(self, ip, port, latency=None, **info):
+        """记录一次确认在线，info 可包含 mac / serial / manufacturer / model / info_read。返回对应记录。"""
+        with self._lock:
+            record = self._devices.get(ip)
+            if record is None:
+                record = self._devices[ip] = DeviceRecord(ip, port)
+            record.port = int(port)
+            record.last_seen = time.time()
+            if latency is not None:
+                record.latency = round(latency, 4)
+            for key, value in info.items():
+                if value:
+                    setattr(record, key, value)
+            return record
+
+    def find(self, mac=None, serial=None):
+        """按 MAC (12 位大写) 或序列号查找设备，返回匹配的记录列表。"""
+        serial = serial.upper() if serial else None
+        return [r for r in self.devices()
+                if (mac and r.mac.replace(':', '') == mac) or (serial and r.serial.upper() == serial)]
+
+    def drop(self, ip):
+        """移除已不在线的设备。"""
+        with self._lock:
+            return self._devices.pop(ip, None)
+
+    def full_scan_due(self, interval=FULL_SCAN_INTERVAL):
+        """是否需要执行一次全量扫描 (清单为空或距上次全量扫描已超过 interval)。"""
+        with self._lock:
+            empty = not self._devices
+        return empty or time.time() - self.last_full_scan > interval
+
+    def mark_full_scan(self):
+        self.last_full_scan = time.time()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 多设备批量修改队列：同时最多 max_parallel 台设备执行修改流程。
+# 每个任务先在事件循环中做设备检查，通过后才占用修改名额，检查与其它设备的修改同时进行。
+
+import time
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import workflow
+from aioengine import get_engine
+
+# 默认同时处理的设备数
+DEFAULT_MAX_PARALLEL = 4
+
+# 任务状态
+VALIDATING = "校验中"
+PENDING = "等待中"
+RUNNING = "运行中"
+SUCCEEDED = "成功"
+FAILED = "失败"
+CANCELLED = "已取消"
+
+# 任务编号在进程内唯一 (重建队列后也不会重复)
+_job_ids = itertools.count(1)
+
+
+class Job:
+    """单台设备的一个修改任务 (mac 为 CheckInput.Mac 或 MAC 字符串)。"""
+
+    __slots__ = ('job_id', 'ip', 'mac', 'account', 'model', 'is_recovering', 'is_resetting',
+                 'status', 'message', 'started', 'finished', 'cancel_event', 'future', 'task')
+
+    def __init__(self, job_id, ip, mac, account, is_recovering, is_resetting, model=None):
+        self.job_id = job_id
+        self.ip = ip
+        self.mac = mac
+        self.account = account
+        self.is_recovering = is_recovering
+        self.is_resetting = is_resetting
+        self.model = model
+        self.status = PENDING
+        self.message = ""
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        # 任务结束 (成功、失败或取消) 时完成，结果为 Job 本身
+        self.future = Future()
+        # 当前阶段的执行：设备检查协程或线程池中的修改流程
+        self.task = None
+
+    @property
+    def elapsed(self):
+        """已耗时 (秒)，未开始时为 0。"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def done(self):
+        return self.status in (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueue:
+    """
+    设备修改任务队列。
+    on_status(job): 任务状态变化时回调 (在工作线程中执行)。
+    on_log(job, msg): 任务日志回调 (在工作线程中执行)。
+    """
+
+    def __init__(self, max_parallel=DEFAULT_MAX_PARALLEL, port=workflow.ADB_PORT, on_status=None, on_log=None):
+        self.max_parallel = max(1, int(max_parallel))
+        self.port = port
+        self.on_status = on_status
+        self.on_log = on_log
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix='job')
+
+    def submit(self, ip, mac, account, is_recovering=False, is_resetting=True, precheck=True, model=None):
+        """
+        加入一个任务，返回 Job。
+        precheck: 先在事件循环中检查设备 (ADB 可连接、厂商正确)，通过后再排队修改。
+        model: 选择串码模板的型号，为空时按设备型号选择 (见 sngen)。
+        """
+        with self._lock:
+            job = Job(next(_job_ids), ip, mac, account, is_recovering, is_resetting, model)
+            if precheck:
+                job.status = VALIDATING
+                # 检查协程与状态一起设置，cancel() 看到 VALIDATING 时 task 一定已存在
+                job.task = get_engine().submit(workflow.precheck(ip, lambda msg: self._log(job, msg), self.port))
+            self.jobs[job.job_id] = job
+        if precheck:
+            job.task.add_done_callback(lambda f: self._on_checked(job, f))
+        self._notify(job)
+        if not precheck:
+            self._start(job)
+        return job
+
+    def _on_checked(self, job, check):
+        """设备检查结束 (在事件循环线程中回调)：通过则进入修改队列"""
+        if job.done:
+            return # 检查期间已被取消
+        try:
+            passed = check.result()
+        except Exception as e:
+            self._finish(job, FAILED, f"设备检查异常: {e}")
+            return
+        with self._lock:
+            if job.done:
+                return # 检查期间已被取消
+            if not passed:
+                status = FAILED
+            else:
+                status = None
+                job.status = PENDING
+        if status is not None:
+            self._finish(job, status, "设备检查未通过")
+            return
+        self._notify(job)
+        self._start(job)
+
+    def _start(self, job):
+        job.task = self._executor.submit(self._run, job)
+
+    def cancel(self, job_id):
+        """
+        取消单个任务：检查中或未开始的直接取消，运行中的在下一个步骤之间停止。
+        返回: 任务存在且尚未结束则 True。
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        job.cancel_event.set()
+        with self._lock:
+            validating = job.status == VALIDATING
+        if validating:
+            # 先结束任务再取消检查协程，检查的回调看到任务已结束会直接返回
+            self._finish(job, CANCELLED, "未开始即被取消")
+            job.task.cancel()
+        elif job.task is not None and job.task.cancel():
+            self._finish(job, CANCELLED, "未开始即被取消")
+        return True
+
+    def active_count(self):
+        """尚未结束的任务数。"""
+        return sum(1 for job in list(self.jobs.values()) if not job.done)
+
+    def wait(self):
+        """阻塞等待当前所有任务结束。"""
+        for job in list(self.jobs.values()):
+            job.future.result()
+
+    def shutdown(self):
+        """取消所有任务并关闭线程池。"""
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED, "未开始即被取消")
+            return job
+
+        job.status = RUNNING
+        job.started = time.monotonic()
+        self._notify(job)
+
+        try:
+            success = workflow.core_program(
+                job.ip, job.mac, job.account, job.is_recovering, job.is_resetting,
+                lambda msg: self._log(job, msg), port=self.port, cancel=job.cancel_event, model=job.model
+            )
+        except Exception as e:
+            self._finish(job, FAILED, f"业务逻辑执行异常: {e}")
+            return job
+
+        if job.cancel_event.is_set() and not success:
+            self._finish(job, CANCELLED, "")
+        else:
+            self._finish(job, SUCCEEDED if success else FAILED, "")
+        return job
+
+    def _finish(self, job, status, message):
+        with self._lock:
+            if job.done:
+                return
+            job.status = status
+            job.message = message
+            job.finished = time.monotonic()
+        self._notify(job)
+        job.future.set_result(job)
+
+    def _log(self, job, msg):
+        if self.on_log is not None:
+            self.on_log(job, msg)
+
+    def _notify(self, job):
+        if self.on_status is not None:
+            self.on_status(job)
@@ -5,22 +5,27 @@
 import sys
 import socket
 import time
+import threading
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QGridLayout, QVBoxLayout, 
     QLabel, QLineEdit, QPushButton, QCheckBox, QTextEdit, QMessageBox,
-    QComboBox
+    QComboBox, QSpinBox, QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog
 )
 # 修正导入：只保留需要的 PySide6.QtCore 模块，避免重复和冗余
-from PySide6.QtCore import Qt, QThread, Signal, Slot, QObject 
+from PySide6.QtCore import Qt, Signal, Slot, QObject 
 from functools import partial
 import function # 导入 function.py 模块
+import workflow # 导入 workflow.py 模块
+import switchkeeper # 导入 switchkeeper.py 模块
 import CheckInput as Ck # 导入 CheckInput.py 模块
+from jobqueue import JobQueue, DEFAULT_MAX_PARALLEL # 导入 jobqueue.py 模块
+from manifest import ManifestRunner # 导入 manifest.py 模块
 from ScanService import ScanService # 导入 ScanService.py 模块
+from aioengine import get_engine # 导入共享的异步引擎
 
 
 version = 'V0.0.3-qt-SCAN'
 port = "5555"
-sn_head = "00570300004221C02117"
 
 
 # --- 修复 socket.gaierror：使用健壮的 IP 获取方法 ---
@@ -38,122 +43,115 @@ def get_local_ip():
 
 l_ip = get_local_ip()
 
-# --- 核心业务逻辑线程类 ---
+# --- 异步引擎与 Qt 的桥接 ---
+class EngineBridge(QObject):
+    """
+    把 AsyncEngine 中的阻塞任务接入 Qt：
+    任务在引擎的事件循环/线程池中执行，完成后通过信号回到 GUI 线程调用回调，
+    不再为每个任务创建 QThread。
+    """
+    _done = Signal(int, object)
+
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self._callbacks = {}
+        self._next_id = 0
+        self._done.connect(self._on_done)
+
+    def submit_blocking(self, fn, *args, callback=None):
+        """提交阻塞函数到引擎线程池，完成后在 GUI 线程中以结果调用 callback。"""
+        return self._track(self.engine.submit_blocking(fn, *args), callback)
+
+    def _track(self, future, callback):
+        self._next_id += 1
+        task_id = self._next_id
+        self._callbacks[task_id] = callback
+        # 回调在工作线程中触发，通过信号排队回到 GUI 线程
+        future.add_done_callback(lambda f: self._done.emit(task_id, f))
+        return future
+
+    @Slot(int, object)
+    def _on_done(self, task_id, future):
+        callback = self._callbacks.pop(task_id, None)
+        if callback is None:
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            result = e
+        callback(result)
+
+# --- 核心业务逻辑类 (在引擎线程池中执行) ---
 class Worker(QObject):
     finished = Signal()
     error = Signal(str)
     log_signal = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # 取消令牌：stop() 设置后流程在下一个步骤之间停止
+        self.cancel_event = threading.Event()
+
+    def stop(self):
+        self.cancel_event.set()
     
-    def set_task(self, method, ip, mac, account, sn_head, is_recovering, is_resetting):
+    def set_task(self, method, ip):
         self.method = method
         self.ip = ip
-        self.mac = mac
-        self.account = account
-        self.sn_head = sn_head
-        self.is_recovering = is_recovering
-        self.is_resetting = is_resetting
-        
+
     @Slot()
     def run(self):
+        # 设备修改由 JobQueue 执行，这里只有单独操作
         try:
-            if self.method == 'core_program':
-                self._core_program_thread_impl()
-            elif self.method == 'reboot_device':
-                self._reboot_device_thread_impl()
+            if self.method == 'reboot_device':
+                workflow.reboot_device(self.ip, self.log_signal.emit, port, cancel=self.cancel_event)
         except Exception as e:
             self.error.emit(f"业务逻辑执行异常: {e}")
         finally:
             self.finished.emit()
 
-    def _core_program_thread_impl(self):
-        ip, mac, account, sn_head = self.ip, self.mac, self.account, self.sn_head
-        is_recovering = self.is_recovering
-        is_resetting = self.is_resetting
-
-        # 2. 修改 MAC
-        if not function.mac_change(mac, ip, port, sn_head):
-            self.log_signal.emit("MAC地址修改失败。尝试直接进行 SN/账号 修改...")
-            if not function.change(ip, mac, account, sn_head, port):
-                self.log_signal.emit("修改失败，请重新尝试。")
-                return
-        
-        self.log_signal.emit("Mac地址修改成功。")
-
-        # 3. 恢复出厂设置流程
-        if is_recovering:
-            if Ck.check_ottx_status(ip, port):
-                self.log_signal.emit("开始恢复出厂设置...")
-                if function.recovery(ip, port):
-                    self.log_signal.emit("恢复出厂设置成功，等待设备重启和初始化 (约 70 秒)...")
-                    function.sleep(70) 
-                    
-                    if function.rec_auto_change(mac, account, port):
-                        self.log_signal.emit("自动拨号成功。")
-                    else:
-                        self.log_signal.emit("自动拨号失败。")
-                else:
-                    self.log_signal.emit("恢复失败，请重新尝试。")
-            else:
-                self.log_signal.emit("设备未处于 OTTX 状态，无法恢复出厂。")
-
-        # 4. 只修改 SN/账号 + 可选重启流程
-        elif is_resetting:
-            if function.change(ip, mac, account, sn_head, port):
-                self.log_signal.emit("串码/账号修改成功。")
-                if function.reboot(ip, port):
-                    self.log_signal.emit("设备重启命令发送成功！")
-                else:
-                    self.log_signal.emit("设备重启失败！")
-            else:
-                self.log_signal.emit("修改失败，请重新尝试。")
-
-        else:
-             self.log_signal.emit("所有操作完成。未进行重启或恢复出厂。")
-
-    def _reboot_device_thread_impl(self):
-        ip = self.ip
-
-        if not Ck.check_adb_status(ip, port):
-            self.log_signal.emit("请检查机顶盒 ADB 调试是否打开。")
-            return
-            
-        self.log_signal.emit(f"已连接到: {ip}，正在执行重启...")
-        if function.reboot(ip, port):
-            self.log_signal.emit("设备重启命令发送成功！")
-        else:
-            self.log_signal.emit("设备重启失败！")
-
 
 class MainGui(QMainWindow):
     """主窗口类，继承自 QMainWindow"""
     log_signal = Signal(str)
+    # job_status: 队列任务状态变化 (由工作线程发出，在 GUI 线程中更新表格)
+    job_status = Signal(object)
 
     def __init__(self):
         super().__init__()
         self.setWindowTitle(f'创维机顶盒串码修改工具 {version}')
-        self.setGeometry(100, 100, 650, 500)
-        self.setFixedSize(650, 500) 
-
-        self.worker_thread = None
-        self.scan_thread = None 
+        self.setGeometry(100, 100, 650, 700)
+        self.setFixedSize(650, 700) 
+
+        self.job_queue = None
+        self._job_rows = {}
+        self.manifest_runner = None
+        self.worker = None
+        self.worker_future = None
+        self.scan_future = None
         self.scan_service = None
+        self.bridge = EngineBridge(get_engine(), self)
 
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         self.log_signal.connect(self.write_log_to_text)
+        self.job_status.connect(self.on_job_status)
 
         self._setup_scan_service()
         self._setup_ui(central_widget)
+        self._setup_job_queue()
 
     def _setup_scan_service(self):
-        """设置局域网扫描服务和线程"""
-        self.scan_thread = QThread()
+        """设置局域网扫描服务 (扫描在引擎线程池中执行)"""
         self.scan_service = ScanService()
-        self.scan_service.moveToThread(self.scan_thread)
-
-        self.scan_thread.started.connect(lambda: self.scan_service.scan_network())
         self.scan_service.scan_finished.connect(self.on_scan_finished)
         self.scan_service.device_found.connect(self.on_device_found)
+        self.scan_service.device_lost.connect(self.on_device_lost)
+        self.scan_service.subnet_progress.connect(self.on_subnet_progress)
+        self.scan_service.log_signal.connect(self.write_log_to_text)
+        self._scan_progress = {}
+        self._locating = False
 
     def _setup_ui(self, parent):
         """设置界面布局和组件"""
@@ -164,7 +162,16 @@ class MainGui(QMainWindow):
         input_layout = QGridLayout(input_widget)
 
         # 本机 IP
-        input_layout.addWidget(QLabel(f"**本机IP为：** <font color='blue'>{l_ip}</font>"), 0, 0, 1, 3)
+        input_layout.addWidget(QLabel(f"**本机IP为：** <font color='blue'>{l_ip}</font>"), 0, 0)
+
+        # 扫描范围：留空为本机所在网段，可填多个 CIDR/地址范围 (逗号分隔)，all 为本机所有网段
+        self.scan_target_Entry = QLineEdit()
+        self.scan_target_Entry.setPlaceholderText("扫描范围: 默认本网段，可填 CIDR/地址范围/all")
+        input_layout.addWidget(self.scan_target_Entry, 0, 1)
+
+        # 全网段：勾选时忽略设备清单，强制扫描整个网段
+        self.full_scan_Check = QCheckBox("全网段")
+        input_layout.addWidget(self.full_scan_Check, 0, 2)
         
         # IP 输入 (QComboBox)
         input_layout.addWidget(QLabel("机顶盒 IP 地址:"), 1, 0)
@@ -175,6 +182,7 @@ class MainGui(QMainWindow):
         default_ip_prefix = ".".join(l_ip.split('.')[:3]) + ".x"
         self.ip_Combo.addItem(default_ip_prefix) # 添加默认网段提示项
         self.ip_Combo.setCurrentText(default_ip_prefix) 
+        self._fill_from_inventory() # 启动时即显示清单中缓存的设备
         input_layout.addWidget(self.ip_Combo, 1, 1)
 
         # 搜索按钮
@@ -209,9 +217,26 @@ class MainGui(QMainWindow):
         self.confirm_Button = QPushButton("确定修改 (耗时操作)")
         self.confirm_Button.setStyleSheet("background-color: #6495ED; color: white;")
         self.confirm_Button.clicked.connect(self.start_core_program)
-        input_layout.addWidget(self.confirm_Button, 4, 0, 1, 3)
+        input_layout.addWidget(self.confirm_Button, 4, 0, 1, 2)
+
+        # 并行数：队列中同时处理的设备数
+        self.parallel_Spin = QSpinBox()
+        self.parallel_Spin.setRange(1, 32)
+        self.parallel_Spin.setValue(DEFAULT_MAX_PARALLEL)
+        self.parallel_Spin.setPrefix("并行数: ")
+        self.parallel_Spin.valueChanged.connect(self.on_parallel_changed)
+        input_layout.addWidget(self.parallel_Spin, 4, 2)
         
         main_layout.addWidget(input_widget)
+
+        # --- 批量任务队列 ---
+        self.job_Table = QTableWidget(0, 6)
+        self.job_Table.setHorizontalHeaderLabels(["IP", "MAC", "账号", "状态", "耗时", "操作"])
+        self.job_Table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.job_Table.verticalHeader().setVisible(False)
+        self.job_Table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.job_Table.setMaximumHeight(160)
+        main_layout.addWidget(self.job_Table)
         
         # --- 2. 提示信息区域 (保持不变) ---
         tips_label = QLabel(
@@ -238,6 +263,28 @@ class MainGui(QMainWindow):
         self.kill_Button.clicked.connect(self.kill_adb)
         button_layout.addWidget(self.kill_Button, 0, 1)
 
+        self.import_Button = QPushButton("批量导入清单")
+        self.import_Button.setStyleSheet("background-color: #FFD700;")
+        self.import_Button.clicked.connect(self.start_manifest)
+        button_layout.addWidget(self.import_Button, 0, 2)
+
+        # 按 MAC/SN 定位：在网段中查找“MAC/SN 地址”栏对应的设备，找到即停止
+        self.locate_Button = QPushButton("按 MAC 定位")
+        self.locate_Button.clicked.connect(self.start_locate)
+        button_layout.addWidget(self.locate_Button, 0, 3)
+
+        # 切换交换机 VLAN：首次使用时登录，之后保持会话，每次只发送切换命令
+        self.vlan_Button = QPushButton("切换交换机 VLAN")
+        self.vlan_Button.setStyleSheet("background-color: #DDA0DD;")
+        self.vlan_Button.clicked.connect(self.start_toggle_vlan)
+        button_layout.addWidget(self.vlan_Button, 1, 0, 1, 2)
+
+        # 全部停止：停止扫描、清单导入、队列中的任务和单独操作
+        self.stop_Button = QPushButton("全部停止")
+        self.stop_Button.setStyleSheet("background-color: #FF6347; color: white;")
+        self.stop_Button.clicked.connect(self.stop_all)
+        button_layout.addWidget(self.stop_Button, 1, 2, 1, 2)
+
         main_layout.addWidget(button_widget)
 
         # --- 4. 日志区域 (保持不变) ---
@@ -249,33 +296,141 @@ class MainGui(QMainWindow):
         
         main_layout.addStretch()
 
-    # --- 线程化操作入口 (保持不变) ---
-    def _start_worker(self, method, ip, mac, account, sn_head, is_recovering, is_resetting):
-        """通用启动工作线程的函数"""
-        if self.worker_thread and self.worker_thread.isRunning():
+    # --- 后台操作入口 ---
+    def _start_worker(self, method, ip):
+        """通用启动后台任务的函数"""
+        if self.worker_future and not self.worker_future.done():
             self.log_signal.emit("警告：当前已有耗时操作正在进行，请等待其完成。")
             return
 
         self.set_buttons_enabled(False)
 
-        self.worker_thread = QThread()
         self.worker = Worker()
-        self.worker.moveToThread(self.worker_thread)
-        self.worker.set_task(method, ip, mac, account, sn_head, is_recovering, is_resetting)
-
-        self.worker_thread.started.connect(self.worker.run)
+        self.worker.set_task(method, ip)
         self.worker.log_signal.connect(self.write_log_to_text)
-        self.worker.finished.connect(self.worker_thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.worker_thread.finished.connect(self.worker_thread.deleteLater)
-        self.worker_thread.finished.connect(lambda: self.set_buttons_enabled(True))
+        self.worker.error.connect(self.write_log_to_text)
+
+        self.worker_future = self.bridge.submit_blocking(
+            self.worker.run, callback=lambda _: self.set_buttons_enabled(True)
+        )
+        self.log_signal.emit(f"任务 '{method}' 已在后台启动...")
+
+    # --- 批量任务队列 ---
+    def _setup_job_queue(self):
+        """按当前并行数创建任务队列 (旧队列此时已空闲)"""
+        if self.job_queue is not None:
+            self.job_queue.shutdown()
+        self.job_queue = JobQueue(
+            max_parallel=self.parallel_Spin.value(), port=port,
+            on_status=self.job_status.emit,
+            on_log=lambda job, msg: self.log_signal.emit(f"[{job.ip}] {msg}"),
+        )
+
+    @Slot(int)
+    def on_parallel_changed(self, value):
+        """并行数变化：队列空闲时立即生效，否则等当前任务全部结束后生效"""
+        if self.job_queue.active_count() == 0 and self.manifest_runner is None:
+            self._setup_job_queue()
+            self.log_signal.emit(f"队列并行数已设置为 {value}。")
+        else:
+            self.log_signal.emit(f"队列中仍有任务，并行数 {value} 将在当前任务全部结束后生效。")
+
+    def _enqueue_job(self, ip, mac, account):
+        """把一台设备加入队列，同一 IP 未结束前不重复加入"""
+        if any(job.ip == ip and not job.done for job in self.job_queue.jobs.values()):
+            self.log_signal.emit(f"警告：设备 {ip} 已在队列中，请等待其完成。")
+            return None
+
+        if (self.job_queue.active_count() == 0 and self.manifest_runner is None
+                and self.job_queue.max_parallel != self.parallel_Spin.value()):
+            self._setup_job_queue()
+
+        job = self.job_queue.submit(
+            ip, mac, account,
+            self.recovery_Check.isChecked(),
+            self.reset_Check.isChecked()
+        )
+        self.log_signal.emit(f"设备 {ip} 已加入队列 (任务 #{job.job_id})。")
+        return job
+
+    def _add_job_row(self, job):
+        row = self.job_Table.rowCount()
+        self.job_Table.insertRow(row)
+        self._job_rows[job.job_id] = row
+        for col, text in enumerate((job.ip, str(job.mac), job.account)):
+            self.job_Table.setItem(row, col, QTableWidgetItem(text))
+        cancel_Button = QPushButton("取消")
+        cancel_Button.clicked.connect(partial(self.cancel_job, job.job_id))
+        self.job_Table.setCellWidget(row, 5, cancel_Button)
+        return row
+
+    @Slot(object)
+    def on_job_status(self, job):
+        """更新队列表格中某个任务的状态"""
+        row = self._job_rows.get(job.job_id)
+        if row is None:
+            row = self._add_job_row(job)
+        self.job_Table.setItem(row, 3, QTableWidgetItem(job.message and f"{job.status}: {job.message}" or job.status))
+        self.job_Table.setItem(row, 4, QTableWidgetItem(f"{job.elapsed:.1f}s" if job.started else ""))
+        cancel_Button = self.job_Table.cellWidget(row, 5)
+        if cancel_Button is not None:
+            cancel_Button.setEnabled(not job.done)
+        if job.done:
+            self.log_signal.emit(f"[{job.ip}] 任务 #{job.job_id} {job.status}，耗时 {job.elapsed:.1f} 秒。")
+
+    def cancel_job(self, job_id):
+        """取消队列中的单个任务"""
+        if self.job_queue.cancel(job_id):
+            self.log_signal.emit(f"任务 #{job_id} 已请求取消。")
+
+    # --- 批量导入 ---
+    @Slot()
+    def start_manifest(self):
+        """选择 CSV/TSV 清单，逐行送入修改队列，结果写入同目录的 .result.csv"""
+        if self.manifest_runner is not None:
+            self.log_signal.emit("警告：已有清单正在处理中，请等待其完成。")
+            return
+
+        path, _ = QFileDialog.getOpenFileName(self, "选择清单文件", "", "清单 (*.csv *.tsv *.txt);;所有文件 (*)")
+        if not path:
+            return
+        result_path = path.rsplit('.', 1)[0] + ".result.csv"
 
-        self.worker_thread.start()
-        self.log_signal.emit(f"任务 '{method}' 已在后台线程启动...")
+        if (self.job_queue.active_count() == 0
+                and self.job_queue.max_parallel != self.parallel_Spin.value()):
+            self._setup_job_queue()
+
+        self.manifest_runner = ManifestRunner(
+            self.job_queue, path, result_path,
+            self.recovery_Check.isChecked(), self.reset_Check.isChecked(),
+            log=self.log_signal.emit,
+        )
+        # 未指定 IP 的行使用已搜索到的设备，以及之后扫描新发现的设备
+        for i in range(self.ip_Combo.count()):
+            text = self.ip_Combo.itemText(i)
+            if text.count('.') == 3 and not text.endswith('.x'):
+                self.manifest_runner.add_device(text)
+
+        self.import_Button.setEnabled(False)
+        self.log_signal.emit(f"开始处理清单: {path}，结果写入: {result_path}")
+        self.bridge.submit_blocking(self.manifest_runner.run, callback=self.on_manifest_finished)
+
+    def on_manifest_finished(self, counts):
+        """清单处理结束"""
+        self.manifest_runner = None
+        self.import_Button.setEnabled(True)
+        if isinstance(counts, Exception):
+            self.log_signal.emit(f"清单处理异常: {counts}")
+            return
+        summary = "，".join(f"{status} {n} 行" for status, n in counts.items())
+        self.log_signal.emit(f"清单处理完成：{summary}。")
 
     @Slot()
     def start_core_program(self):
-        """启动核心修改流程"""
+        """
+        把当前输入的设备加入修改队列。
+        这里只做输入格式检查；设备检查 (ADB、厂商) 由队列在后台执行，结果通过日志和队列表格显示。
+        """
         ip = self.ip_Combo.currentText().strip()
         mac = self.mac_Entry.text().strip()
         account = self.account_Entry.text().strip()
@@ -283,11 +438,8 @@ class MainGui(QMainWindow):
         if not self._check_preconditions(ip, mac, account):
             return
 
-        self._start_worker(
-            'core_program', ip, mac, account, sn_head, 
-            self.recovery_Check.isChecked(), 
-            self.reset_Check.isChecked()
-        )
+        # 格式已检查，之后整个流程传递解析好的 Mac
+        self._enqueue_job(ip, Ck.Mac.parse(mac), account)
 
     @Slot()
     def start_reboot_device(self):
@@ -298,50 +450,153 @@ class MainGui(QMainWindow):
             self.log_signal.emit("请检查 IP 地址是否正确。")
             return
             
-        self._start_worker(
-            'reboot_device', ip, None, None, None, False, False
-        )
+        self._start_worker('reboot_device', ip)
+
+    @Slot()
+    def start_toggle_vlan(self):
+        """切换交换机 VLAN (使用 config.json 中的交换机，会话在两次切换之间保持)"""
+        self.vlan_Button.setEnabled(False)
+        self.log_signal.emit("正在切换交换机 VLAN...")
+        self.bridge.submit_blocking(workflow.toggle_vlan, self.log_signal.emit, callback=self.on_vlan_toggled)
+
+    def on_vlan_toggled(self, success):
+        """交换机 VLAN 切换结束"""
+        self.vlan_Button.setEnabled(True)
+        if isinstance(success, Exception):
+            self.log_signal.emit(f"切换交换机 VLAN 异常: {success}")
+        elif success:
+            self.log_signal.emit("交换机 VLAN 切换完成。")
+        else:
+            self.log_signal.emit("部分交换机 VLAN 切换失败，请查看日志。")
+
+    # --- 局域网搜索逻辑 ---
+    def _fill_from_inventory(self):
+        """把设备清单中缓存的设备立即加入 ComboBox，随后由扫描确认或移除"""
+        for record in self.scan_service.inventory.devices():
+            if self.ip_Combo.findText(record.ip) == -1:
+                self.ip_Combo.addItem(record.ip)
+
+    def _scanning(self):
+        return self.scan_future is not None and not self.scan_future.done()
 
-    # --- 局域网搜索逻辑 (保持不变) ---
     @Slot()
     def start_scan(self):
-        """启动局域网扫描"""
-        if self.scan_thread and self.scan_thread.isRunning():
-            self.log_signal.emit("警告：设备扫描正在进行中，请耐心等待。")
+        """启动局域网扫描 (先显示清单缓存，再复核；勾选“全网段”时强制全量扫描)；扫描中再次点击则停止扫描"""
+        if self._scanning():
+            self.stop_scan()
             return
         
-        self.ip_Combo.clear()
-        self.ip_Combo.addItem("正在扫描中...")
-        self.ip_Combo.setEnabled(False)
-        self.search_Button.setEnabled(False)
-        self.search_Button.setText("扫描中...")
-        self.log_signal.emit(f"开始扫描局域网 ({l_ip.rsplit('.', 1)[0]}.1-255)...")
-        self.scan_thread.start()
+        self._fill_from_inventory()
+        self.search_Button.setText("停止扫描")
+        self._scan_progress = {}
+        full = self.full_scan_Check.isChecked()
+        targets = self.scan_target_Entry.text().strip() or None
+        if targets:
+            self.log_signal.emit(f"开始扫描指定范围: {targets}")
+        elif full:
+            self.log_signal.emit(f"开始全量扫描局域网 ({l_ip.rsplit('.', 1)[0]}.1-255)...")
+        else:
+            self.log_signal.emit("开始扫描：先复核已知设备...")
+        self.scan_future = self.bridge.submit_blocking(self.scan_service.scan_network, 1, 255, full, targets)
+
+    @Slot()
+    def start_locate(self):
+        """按“MAC/SN 地址”栏查找设备，找到后自动选中其 IP"""
+        target = self.mac_Entry.text().strip()
+        if not target:
+            self.log_signal.emit("请先在“MAC/SN 地址”栏输入要查找的 MAC 或序列号。")
+            return
+        if self._scanning():
+            self.log_signal.emit("警告：设备扫描正在进行中，请耐心等待。")
+            return
+
+        self.search_Button.setText("停止查找")
+        self.locate_Button.setEnabled(False)
+        self._scan_progress = {}
+        self._locating = True
+        targets = self.scan_target_Entry.text().strip() or None
+        self.scan_future = self.bridge.submit_blocking(self.scan_service.find_device, target, targets)
+
+    @Slot(str, int, int)
+    def on_subnet_progress(self, label, done, total):
+        """按网段显示扫描进度，搜索按钮上显示总进度"""
+        self._scan_progress[label] = (done, total)
+        all_done = sum(d for d, _ in self._scan_progress.values())
+        all_total = sum(t for _, t in self._scan_progress.values())
+        self.search_Button.setText(f"停止扫描 ({all_done * 100 // max(1, all_total)}%)")
+        if done == total:
+            self.log_signal.emit(f"网段 {label} 探测完成 ({total} 个地址)。")
+
+    @Slot()
+    def stop_scan(self):
+        """停止正在进行的扫描，结束后由 on_scan_finished 恢复按钮"""
+        if self._scanning():
+            self.scan_service.stop()
+            self.search_Button.setEnabled(False)
+            self.search_Button.setText("正在停止...")
+
+    @Slot()
+    def stop_all(self):
+        """停止扫描、清单导入、队列中的所有任务以及单独的后台操作"""
+        self.stop_scan()
+        if self.manifest_runner is not None:
+            self.manifest_runner.stop()
+        for job_id in list(self.job_queue.jobs):
+            self.job_queue.cancel(job_id)
+        if self.worker_future and not self.worker_future.done():
+            self.worker.stop()
+        self.log_signal.emit("已请求停止所有后台操作。")
+
+    def closeEvent(self, event):
+        """关闭窗口时取消所有后台操作，释放 socket 和线程"""
+        self.stop_all()
+        self.job_queue.shutdown()
+        try:
+            get_engine().run(switchkeeper.close_keeper(), timeout=5)
+        except Exception as e:
+            # 交换机无响应时不阻止窗口关闭
+            self.log_signal.emit(f"退出交换机会话失败: {e!r}")
+        super().closeEvent(event)
 
     @Slot(str)
     def on_device_found(self, ip_port_str):
         """找到设备时更新 ComboBox"""
         ip = ip_port_str.split(':')[0]
+        if self.manifest_runner is not None:
+            self.manifest_runner.add_device(ip)
         if self.ip_Combo.findText(ip) == -1:
             self.ip_Combo.addItem(ip)
             self.log_signal.emit(f"发现设备: {ip}")
+
+    @Slot(str)
+    def on_device_lost(self, ip_port_str):
+        """清单中的设备复核后不在线，从 ComboBox 中移除"""
+        ip = ip_port_str.split(':')[0]
+        index = self.ip_Combo.findText(ip)
+        if index != -1 and self.ip_Combo.currentText() != ip:
+            self.ip_Combo.removeItem(index)
+        self.log_signal.emit(f"设备已离线: {ip}")
         
     @Slot(list)
     def on_scan_finished(self, found_devices):
         """扫描完成后重置界面状态"""
-        self.scan_thread.quit()
-        
-        self.ip_Combo.removeItem(self.ip_Combo.findText("正在扫描中..."))
-        self.ip_Combo.setEnabled(True)
         self.search_Button.setText("搜索设备")
         self.search_Button.setEnabled(True)
-        
+        self.locate_Button.setEnabled(True)
+
+        if self._locating:
+            self._locating = False
+            if found_devices:
+                self.ip_Combo.setCurrentText(found_devices[0].split(':')[0])
+            return
+
         if not found_devices:
             self.log_signal.emit("扫描完成。未找到任何 ADB 设备。")
         else:
             self.log_signal.emit(f"扫描完成。共找到 {len(found_devices)} 个 ADB 设备。")
-            # 默认选中第一个，并确保文本框显示的是 IP
-            self.ip_Combo.setCurrentText(found_devices[0].split(':')[0]) 
+            # 尚未选择设备时默认选中第一个，并确保文本框显示的是 IP
+            if self.ip_Combo.currentText().endswith('.x'):
+                self.ip_Combo.setCurrentText(found_devices[0].split(':')[0]) 
 
     # --- 辅助方法 (保持不变) ---
     def set_buttons_enabled(self, enabled):
@@ -349,8 +604,8 @@ class MainGui(QMainWindow):
         self.confirm_Button.setEnabled(enabled)
         self.reboot_Button.setEnabled(enabled)
         self.kill_Button.setEnabled(enabled)
-        # 注意：扫描线程完成后，搜索按钮才会被 on_scan_finished 启用
-        if not self.scan_thread.isRunning():
+        # 注意：扫描完成后，搜索按钮才会被 on_scan_finished 启用
+        if not self._scanning():
             self.search_Button.setEnabled(enabled)
 
         if not enabled:
@@ -359,7 +614,7 @@ class MainGui(QMainWindow):
             self.log_signal.emit("后台操作完成，GUI 解锁。")
             
     def _check_preconditions(self, ip, mac, account):
-        """检查IP、ADB状态和厂商是否正确"""
+        """检查 IP 和 MAC 的格式 (不访问网络，设备检查见 workflow.precheck)"""
         if not ip.strip():
             self.log_signal.emit("请输入机顶盒IP地址。")
             return False
@@ -368,18 +623,6 @@ class MainGui(QMainWindow):
             self.log_signal.emit("请输入正确的机顶盒IP地址。")
             return False
         
-        if not Ck.check_adb_status(ip, port):
-            self.log_signal.emit("请检查机顶盒 **ADB 调试** 是否打开。")
-            return False
-
-        self.log_signal.emit(f"已连接到: {ip}")
-        
-        if not Ck.check_manufacturer("SKYWORTH", ip):
-            self.log_signal.emit("厂商不正确，请检查是否为创维机顶盒。")
-            return False
-        
-        self.log_signal.emit("厂家正确")
-        
         if not mac.strip(): # 新增检查：MAC地址不能为空
             self.log_signal.emit("MAC地址不能为空。")
             return False
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 批量导入：逐行读取 CSV/TSV 清单 (MAC, 账号, 可选 IP)，边读边送入修改队列，并写出逐行结果文件。
+
+import csv
+import time
+import queue
+import asyncio
+import threading
+
+import sngen
+import jobqueue
+import fingerprint
+import CheckInput as Ck # 导入 CheckInput.py 模块
+from aioengine import get_engine
+
+# 清单表头中可识别的列名
+_HEADER_NAMES = {'mac', 'account', '账号', 'ip'}
+
+# 校验未通过的行在结果文件中的状态
+INVALID = "无效"
+
+RESULT_FIELDS = ['line', 'mac', 'account', 'ip', 'status', 'message', 'elapsed', 'finished_at']
+
+
+class ManifestRow:
+    """清单中的一行 (mac 为原始输入，parsed 为解析后的 Mac)，error 非空表示校验未通过。"""
+
+    __slots__ = ('line', 'mac', 'account', 'ip', 'error', 'parsed')
+
+    def __init__(self, line, mac, account, ip, error="", parsed=None):
+        self.line = line
+        self.mac = mac
+        self.account = account
+        self.ip = ip
+        self.error = error
+        self.parsed = parsed
+
+
+def validate_row(line, fields, validator):
+    """用 CheckInput.BatchValidator 校验一行 (含与之前各行的 MAC/SN 查重)，返回 ManifestRow。"""
+    fields = [f.strip() for f in fields] + ["", "", ""]
+    mac, account, ip = fields[:3]
+    checked = validator.check(line, mac, account, ip)
+    return ManifestRow(line, mac, account, ip, checked.error, checked.mac)
+
+
+def read_manifest(path, validator=None):
+    """
+    逐行读取清单文件 (不会一次性载入内存)，逐个产出 ManifestRow。
+    分隔符按首个非空行判断：含制表符则为 TSV，否则为 CSV；表头行与空行会被跳过。
+    validator: CheckInput.BatchValidator，未给出时新建一个 (只做 MAC 查重)。
+    """
+    validator = validator or Ck.BatchValidator()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        delimiter = None
+        for line, text in enumerate(f, 1):
+            if not text.strip() or text.lstrip().startswith('#'):
+                continue
+            if delimiter is None:
+                delimiter = '\t' if '\t' in text else ','
+                fields = next(csv.reader([text], delimiter=delimiter))
+                if {x.strip().lower() for x in fields} & _HEADER_NAMES:
+                    continue # 表头
+            else:
+                fields = next(csv.reader([text], delimiter=delimiter))
+            yield validate_row(line, fields, validator)
+
+
+class ResultWriter:
+    """线程安全地逐行写出结果文件，每行写完立即落盘。"""
+
+    def __init__(self, path):
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+        self._writer.writeheader()
+        self._lock = threading.Lock()
+
+    def write(self, row, status, message="", elapsed=0.0, ip=None):
+        with self._lock:
+            self._writer.writerow({
+                'line': row.line, 'mac': row.mac, 'account': row.account,
+                'ip': ip if ip is not None else row.ip,
+                'status': status, 'message': message,
+                'elapsed': f"{elapsed:.2f}",
+                'finished_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ManifestRunner:
+    """
+    把清单逐行送入 JobQueue。
+    已确定设备的行按队列并行数凑成一批，在一个事务中预留整批串码后再提交；
+    在途任务数不超过队列并行数，因此清单最多只比当前处理的位置多读一批；
+    未指定 IP 的行等待 add_device() 提供的下一台可用设备 (例如扫描发现的设备)，等待前先提交已凑好的行。
+    """
+
+    def __init__(self, job_queue, path, result_path, is_recovering=False, is_resetting=True,
+                 device_timeout=300, log=None, model=None):
+        self.job_queue = job_queue
+        self.path = path
+        self.result_path = result_path
+        self.is_recovering = is_recovering
+        self.is_resetting = is_resetting
+        self.device_timeout = device_timeout
+        self.model = model
+        self.log = log or (lambda msg: None)
+        self.counts = {jobqueue.SUCCEEDED: 0, jobqueue.FAILED: 0, jobqueue.CANCELLED: 0, INVALID: 0}
+        self._devices = queue.Queue()
+        self._used_ips = {} # 已分配的设备 IP -> 使用它的行号
+        self._slots = threading.Semaphore(job_queue.max_parallel)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def add_device(self, ip):
+        """提供一台可用设备，供未指定 IP 的行使用 (同一 IP 只分配一次)。"""
+        self._devices.put(ip)
+
+    def stop(self):
+        """停止读取后续行，已提交的任务继续执行。"""
+        self._stop.set()
+
+    def run(self):
+        """阻塞执行整个清单，返回各状态的行数统计。"""
+        writer = ResultWriter(self.result_path)
+        try:
+            generator = sngen.get_generator()
+            # 未指定型号时模板取决于各设备指纹中的型号，读清单时无从得知，此时不预先做 SN 查重
+            # (SN 冲突由整批预留在提交前查出)
+            sn_for = (lambda mac: generator.preview(mac, self.model)) if self.model is not None else None
+            validator = Ck.BatchValidator(sn_for)
+            wave = [] # 已确定设备、尚未预留串码的行 [(row, ip), ...]
+            for row in read_manifest(self.path, validator):
+                if self._stop.is_set():
+                    break
+                if row.error:
+                    self._count(INVALID)
+                    writer.write(row, INVALID, row.error)
+                    self.log(f"第 {row.line} 行无效: {row.error}")
+                    continue
+
+                if row.ip in self._used_ips:
+                    # 同一台设备不能同时被两个任务修改
+                    error = f"IP与第 {self._used_ips[row.ip]} 行重复"
+                    self._count(INVALID)
+                    writer.write(row, INVALID, error)
+                    self.log(f"第 {row.line} 行无效: {error}")
+                    continue
+                if row.ip:
+                    ip = row.ip
+                else:
+                    # 已凑好的行不跟着等待设备
+                    self._submit_wave(wave, generator, writer)
+                    wave = []
+                    ip = self._next_device()
+                if ip is None and self._stop.is_set():
+                    break # 用户停止，不是等待设备超时
+                if ip is None:
+                    self._count(jobqueue.FAILED)
+                    writer.write(row, jobqueue.FAILED, "等待可用设备超时")
+                    self.log(f"第 {row.line} 行等待可用设备超时。")
+                    continue
+                self._used_ips[ip] = row.line
+
+                wave.append((row, ip))
+                if len(wave) >= self.job_queue.max_parallel:
+                    self._submit_wave(wave, generator, writer)
+                    wave = []
+            self._submit_wave(wave, generator, writer)
+
+            # 取回全部名额，即等待所有任务的结果写完
+            for _ in range(self.job_queue.max_parallel):
+                self._slots.acquire()
+        finally:
+            writer.close()
+        return self.counts
+
+    def _submit_wave(self, wave, generator, writer):
+        """为一批行预留串码，再逐行提交任务；停止后不再提交，已预留的串码撤销。"""
+        reserved = self._reserve(wave, generator, writer) if wave else []
+        for i, (row, ip, sn) in enumerate(reserved):
+            # 在途任务达到并行数时在此等待
+            self._slots.acquire()
+            if self._stop.is_set():
+                self._slots.release()
+                for _, _, unused in reserved[i:]:
+                    generator.release(unused)
+                return
+            job = self.job_queue.submit(ip, row.parsed, row.account, self.is_recovering,
+                                        self.is_resetting, model=self.model)
+            job.future.add_done_callback(lambda _, job=job, row=row, sn=sn: self._on_done(job, row, sn, writer))
+
+    def _reserve(self, wave, generator, writer):
+        """
+        在一个事务中为整批行预留串码，每行按修改流程将使用的型号选择模板
+        (指定了 model 时用它，否则取该设备指纹中的型号)。
+        有冲突时整批回滚：冲突的行记为失败，其余行重新预留。
+        返回: [(row, ip, SN), ...]
+        """
+        pending = [(row, ip, model) for (row, ip), model in zip(wave, self._models([ip for _, ip in wave]))]
+        while pending:
+            results = generator.allocate_batch([(row.parsed, model, row.account) for row, _, model in pending])
+            if all(sn for sn, _ in results):
+                return [(row, ip, sn) for (row, ip, _), (sn, _) in zip(pending, results)]
+            remaining = []
+            for item, (_, error) in zip(pending, results):
+                if not error:
+                    remaining.append(item)
+                    continue
+                row, ip, _ = item
+                self._count(jobqueue.FAILED)
+                writer.write(row, jobqueue.FAILED, f"串码分配失败: {error}", ip=ip)
+                self.log(f"第 {row.line} 行串码分配失败: {error}")
+            pending = remaining
+        return []
+
+    def _models(self, ips):
+        """各设备选择串码模板的型号 (同时读取设备指纹，留在缓存中供前置检查使用)。"""
+        if self.model is not None:
+            return [self.model] * len(ips)
+        port = self.job_queue.port
+
+        async def fetch_all():
+            return await asyncio.gather(*(fingerprint.cache.get_async(ip, port) for ip in ips))
+
+        return [device.model if device is not None else None for device in get_engine().run(fetch_all())]
+
+    def _next_device(self):
+        """取下一台尚未分配过的设备 IP，超时返回 None。"""
+        deadline = time.monotonic() + self.device_timeout
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                ip = self._devices.get(timeout=min(remaining, 1.0))
+            except queue.Empty:
+                continue
+            if ip not in self._used_ips:
+                return ip
+        return None
+
+    def _count(self, status):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def _on_done(self, job, row, sn, writer):
+        status = job.status if job.done else jobqueue.CANCELLED
+        if status != jobqueue.SUCCEEDED:
+            # 未写入设备的预留 (例如设备检查未通过) 撤销，已确认的不受影响
+            sngen.get_generator().release(sn)
+        self._count(status)
+        writer.write(row, status, job.message, job.elapsed, ip=job.ip)
+        self._slots.release()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 邻居表 (ARP 缓存) 读取：Linux 下直接读 /proc/net/arp，其它平台回退到 arp -a 命令。
+
+import os
+import re
+import time
+import socket
+import threading
+from subprocess import getstatusoutput as gso
+
+from CheckInput import normalize_mac # MAC 规范化与输入校验共用同一实现
+
+PROC_ARP = '/proc/net/arp'
+
+# /proc/net/arp 中 Flags 为 0x0 的是未完成解析的条目
+_ATF_COM = 0x2
+
+# 兼容 Windows (192.168.1.1  aa-bb-cc-dd-ee-ff  动态) 与 Linux/macOS (? (192.168.1.1) at a:b:c:d:e:f on en0) 格式
+_ARP_LINE_RE = re.compile(
+    r'\(?(\d{1,3}(?:\.\d{1,3}){3})\)?\s+(?:at\s+)?([0-9a-f]{1,2}(?:[-:][0-9a-f]{1,2}){5})(?![-:0-9a-f])',
+    re.IGNORECASE
+)
+
+_EMPTY_MACS = {'000000000000', 'FFFFFFFFFFFF'}
+
+# 主动解析：探测报文发往的 UDP 端口 (discard)，解析超时与轮询间隔，MAC->IP 缓存有效期
+POKE_PORT = 9
+RESOLVE_TIMEOUT = 3.0
+RESOLVE_POLL = 0.2
+CACHE_TTL = 120
+
+
+def _read_proc():
+    """读取 /proc/net/arp，返回 [(ip, mac12), ...]。"""
+    entries = []
+    with open(PROC_ARP, 'r') as f:
+        next(f, None) # 表头
+        for line in f:
+            fields = line.split()
+            if len(fields) < 4 or not int(fields[2], 16) & _ATF_COM:
+                continue
+            mac = normalize_mac(fields[3], pad=True)
+            if mac and mac not in _EMPTY_MACS:
+                entries.append((fields[0], mac))
+    return entries
+
+
+def _read_command():
+    """调用系统 arp -a 并解析输出，返回 [(ip, mac12), ...]。"""
+    status, data = gso('arp -a')
+    if status != 0:
+        return []
+    if isinstance(data, bytes):
+        data = data.decode('gbk', errors='ignore')
+    entries = []
+    for ip, found_mac in _ARP_LINE_RE.findall(data):
+        mac = normalize_mac(found_mac, pad=True)
+        if mac and mac not in _EMPTY_MACS:
+            entries.append((ip, mac))
+    return entries
+
+
+class NeighborTable:
+    """
+    MAC -> IP 索引的邻居表。
+    refresh() 重新读取系统 ARP 缓存并整体替换索引，可在轮询循环中频繁调用。
+    """
+
+    def __init__(self):
+        self._by_mac = {}
+        self._by_ip = {}
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._use_proc = os.path.exists(PROC_ARP)
+
+    def refresh(self, max_age=0.0):
+        """重新读取 ARP 缓存；若距上次读取不足 max_age 秒则跳过。"""
+        if max_age and time.monotonic() - self.refreshed_at < max_age:
+            return
+        with self._lock:
+            entries = _read_proc() if self._use_proc else _read_command()
+            by_mac = {}
+            by_ip = {}
+            for ip, mac in entries:
+                by_mac.setdefault(mac, []).append(ip)
+                by_ip[ip] = mac
+            self._by_mac, self._by_ip = by_mac, by_ip
+            self.refreshed_at = time.monotonic()
+
+    def lookup(self, mac):
+        """返回 MAC 对应的 IP (同一 MAC 有多个条目时取最后一个)，未找到返回 None。"""
+        ips = self.lookup_all(mac)
+        return ips[-1] if ips else None
+
+    def lookup_all(self, mac):
+        """返回 MAC 对应的所有 IP。"""
+        mac = normalize_mac(mac)
+        if mac is None:
+            return []
+        return list(self._by_mac.get(mac, ()))
+
+    def mac_of(self, ip):
+        """返回 IP 对应的 12 位大写 MAC，未找到返回 None。"""
+        return self._by_ip.get(ip)
+
+    def __len__(self):
+        return len(self._by_ip)
+
+
+def poke(hosts, port=POKE_PORT):
+    """
+    向每个主机发送一个空 UDP 报文，促使系统对其发起 ARP 解析从而填充邻居表。
+    只发送不等待回应，整个网段只需几毫秒。返回成功发出的报文数。
+    """
+    sent = 0
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setblocking(False)
+        for ip in hosts:
+            try:
+                s.sendto(b'', (ip, port))
+                sent += 1
+            except OSError:
+                pass # 广播地址、不可达网段等
+    finally:
+        s.close()
+    return sent
+
+
+class MacResolver:
+    """
+    主动的 MAC -> IP 解析器，带有限时缓存，在多个任务之间共享。
+    缓存未命中时先查邻居表，仍未找到则向给定网段发送探测报文，再轮询邻居表直到超时。
+    """
+
+    def __init__(self, neighbor_table, ttl=CACHE_TTL):
+        self.table = neighbor_table
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def remember(self, mac, ip):
+        mac = normalize_mac(mac)
+        if mac:
+            with self._lock:
+                self._cache[mac] = (ip, time.monotonic() + self.ttl)
+
+    def forget(self, mac):
+        """丢弃某个 MAC 的缓存 (例如设备恢复出厂、重新获取地址后)。"""
+        mac = normalize_mac(mac)
+        with self._lock:
+            self._cache.pop(mac, None)
+
+    def cached(self, mac):
+        """返回未过期的缓存 IP，没有则返回 None。"""
+        mac = normalize_mac(mac)
+        with self._lock:
+            entry = self._cache.get(mac)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._cache[mac]
+                return None
+            return entry[0]
+
+    def resolve(self, mac, hosts=(), timeout=RESOLVE_TIMEOUT, verify=None):
+        """
+        解析 MAC 对应的 IP。
+        hosts: 未命中时发送探测报文的地址列表 (通常为本机所在网段)。
+        verify(ip): 可选的校验函数，只接受校验通过的 IP (例如端口已开放)。
+        返回: IP 字符串，超时返回 None。
+        """
+        mac = normalize_mac(mac)
+        if mac is None:
+            return None
+
+        ip = self.cached(mac)
+        if ip is not None and (verify is None or verify(ip)):
+            return ip
+
+        deadline = time.monotonic() + timeout
+        poked = False
+        while True:
+            self.table.refresh()
+            # 同一 MAC 可能残留旧条目，从最新的开始校验
+            for ip in reversed(self.table.lookup_all(mac)):
+                if verify is None or verify(ip):
+                    self.remember(mac, ip)
+                    return ip
+            if time.monotonic() >= deadline:
+                return None
+            if not poked and hosts:
+                poke(hosts)
+                poked = True
+            time.sleep(RESOLVE_POLL)
+
+
+# 进程内共享的邻居表与解析器
+table = NeighborTable()
+resolver = MacResolver(table)
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+
+import time
+import errno
+import socket
+import struct
+import ipaddress
+import selectors
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import adb_async
+import CheckInput as Ck # 导入 CheckInput.py 模块
+from aioengine import get_engine
+
+# 默认的 ADB 端口
+ADB_PORT = 5555
+
+# 默认并发上限：同一时刻最多进行多少个 ADB 握手
+DEFAULT_MAX_WORKERS = 32
+
+# 第一阶段 TCP 端口探测：同时挂起的非阻塞 socket 数及超时
+# Windows 下 select 最多支持 512 个句柄，这里保持在其之下
+DEFAULT_MAX_SOCKETS = 256
+DEFAULT_SWEEP_TIMEOUT = 0.5
+
+# 单个扫描目标最多包含的地址数 (/20)，防止误填过大的网段
+MAX_TARGET_HOSTS = 4096
+
+# 等待握手结果时检查取消令牌的间隔 (秒)
+CANCEL_POLL = 0.2
+
+# 非阻塞 connect 正在进行中的返回码 (Windows 下为 WSAEWOULDBLOCK)
+_CONNECT_PENDING = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, 10035}
+
+
+class ScanStats:
+    """
+    单次扫描的统计信息：探测主机数、耗时、峰值并发。
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.hosts_probed = 0
+        self.ports_open = 0
+        self.handshakes = 0
+        self.devices_found = 0
+        self.sweep_elapsed = 0.0
+        self.elapsed = 0.0
+        self.peak_concurrency = 0
+        # 达到 limit 或被取消而提前结束，剩余地址未探测
+        self.stopped_early = False
+        self.cancelled = False
+
+    def as_dict(self):
+        return {
+            'max_workers': self.max_workers,
+            'hosts_probed': self.hosts_probed,
+            'ports_open': self.ports_open,
+            'handshakes': self.handshakes,
+            'devices_found': self.devices_found,
+            'sweep_elapsed': round(self.sweep_elapsed, 3),
+            'elapsed': round(self.elapsed, 3),
+            'peak_concurrency': self.peak_concurrency,
+            'stopped_early': self.stopped_early,
+            'cancelled': self.cancelled,
+        }
+
+    def __str__(self):
+        return (f"探测 {self.hosts_probed} 个地址 (端口开放 {self.ports_open} 个)，发现 {self.devices_found} 个设备，"
+                f"耗时 {self.elapsed:.2f} 秒 (端口探测 {self.sweep_elapsed:.2f} 秒)，"
+                f"峰值并发 {self.peak_concurrency}/{self.max_workers}"
+                + ("，已取消" if self.cancelled else "，已提前结束" if self.stopped_early else ""))
+
+
+# --- 扫描目标解析 ---
+
+class ScanTarget:
+    """一个扫描目标 (网段、地址范围或单个地址) 及其展开后的地址列表。"""
+
+    __slots__ = ('label', 'hosts')
+
+    def __init__(self, label, hosts):
+        self.label = label
+        self.hosts = hosts
+
+
+def get_local_ip():
+    """通过默认路由获取本机 IP"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(('8.8.8.8', 80))
+        return s.getsockname()[0]
+    except Exception:
+        return '127.0.0.1'
+    finally:
+        s.close()
+
+
+def local_networks():
+    """
+    本机所有 IPv4 接口所在的网段 (不含回环)。
+    Linux 下通过 ioctl 读取每个接口的地址和掩码；其它平台按本机地址的 /24 处理。
+    """
+    networks = []
+    try:
+        import fcntl
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for _, name in socket.if_nameindex():
+                ifreq = struct.pack('256s', name.encode()[:15])
+                try:
+                    addr = socket.inet_ntoa(fcntl.ioctl(s.fileno(), 0x8915, ifreq)[20:24]) # SIOCGIFADDR
+                    mask = socket.inet_ntoa(fcntl.ioctl(s.fileno(), 0x891b, ifreq)[20:24]) # SIOCGIFNETMASK
+                except OSError:
+                    continue # 接口没有 IPv4 地址
+                networks.append(ipaddress.IPv4Interface(f"{addr}/{mask}"))
+        finally:
+            s.close()
+    except (ImportError, AttributeError, OSError):
+        addrs = {get_local_ip()}
+        try:
+            addrs.update(info[4][0] for info in socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET))
+        except OSError:
+            pass
+        networks = [ipaddress.IPv4Interface(f"{addr}/24") for addr in addrs]
+
+    result = []
+    for iface in networks:
+        if iface.ip.is_loopback or iface.ip.is_link_local:
+            continue
+        net = iface.network
+        # 过大的网段只扫描本机地址所在的 /20
+        if net.num_addresses > MAX_TARGET_HOSTS:
+            net = ipaddress.IPv4Interface(f"{iface.ip}/20").network
+        if net not in result:
+            result.append(net)
+    return result
+
+
+def _range_hosts(text):
+    """'a.b.c.d-e.f.g.h' 或 'a.b.c.d-h' 形式的地址范围"""
+    start, end = (x.strip() for x in text.split('-', 1))
+    first = ipaddress.IPv4Address(start)
+    if '.' not in end:
+        end = start.rsplit('.', 1)[0] + '.' + end
+    last = ipaddress.IPv4Address(end)
+    if last < first:
+        raise ValueError(f"地址范围起止颠倒: {text}")
+    if int(last) - int(first) + 1 > MAX_TARGET_HOSTS:
+        raise ValueError(f"地址范围过大 (最多 {MAX_TARGET_HOSTS} 个地址): {text}")
+    return [str(ipaddress.IPv4Address(i)) for i in range(int(first), int(last) + 1)]
+
+
+def _network_hosts(net):
+    if net.num_addresses > MAX_TARGET_HOSTS:
+        raise ValueError(f"网段过大 (最多 {MAX_TARGET_HOSTS} 个地址): {net}")
+    if net.num_addresses == 1:
+        return [str(net.network_address)]
+    return [str(ip) for ip in net.hosts()]
+
+
+def parse_targets(specs, exclude=()):
+    """
+    解析扫描目标，返回 [ScanTarget, ...]。
+    specs: 字符串 (逗号或空白分隔) 或字符串列表，每项可以是
+           CIDR ('192.168.0.0/22')、地址范围 ('10.0.0.5-10.0.0.80' 或 '10.0.0.5-80')、
+           单个地址，或 'all' (本机所有接口所在网段)。
+    重叠的目标只扫描一次；exclude 中的地址 (例如本机 IP) 会被跳过。
+    格式错误时抛出 ValueError。
+    """
+    if isinstance(specs, str):
+        specs = specs.replace(',', ' ').split()
+
+    seen = set(exclude)
+    targets = []
+    for spec in specs:
+        if spec.lower() in ('all', 'local'):
+            items = [(str(net), _network_hosts(net)) for net in local_networks()]
+        elif '-' in spec:
+            items = [(spec, _range_hosts(spec))]
+        else:
+            try:
+                net = ipaddress.IPv4Network(spec, strict=False)
+            except ValueError:
+                raise ValueError(f"无法识别的扫描目标: {spec}")
+            items = [(str(net), _network_hosts(net))]
+
+        for label, hosts in items:
+            hosts = [ip for ip in hosts if ip not in seen]
+            seen.update(hosts)
+            if hosts:
+                targets.append(ScanTarget(label, hosts))
+    return targets
+
+
+def interleave(targets):
+    """轮流从各个目标中取地址，使并发预算均匀分布在所有网段上。"""
+    iters = [iter(t.hosts) for t in targets]
+    while iters:
+        for it in list(iters):
+            ip = next(it, None)
+            if ip is None:
+                iters.remove(it)
+            else:
+                yield ip
+
+# --- 扫描 ---
+
+def iter_sweep(hosts, port=ADB_PORT, timeout=DEFAULT_SWEEP_TIMEOUT, max_sockets=DEFAULT_MAX_SOCKETS, on_done=None,
+               cancel=None):
+    """
+    第一阶段：单线程非阻塞 TCP connect 探测。
+    同时最多挂起 max_sockets 个连接，每个连接最多等待 timeout 秒，
+    每当有主机接受连接就立即产出该主机，不做任何 ADB 握手。
+    提前关闭生成器 (close) 或设置 cancel (threading.Event) 会关闭所有挂起的连接，
+    取消最迟在 timeout 秒内生效。
+    on_done(ip, is_open): 每个地址探测结束时回调 (用于进度统计)。
+    """
+    on_done = on_done or (lambda ip, is_open: None)
+    sel = selectors.DefaultSelector()
+    inflight = {} # socket -> 截止时间，按插入顺序即为截止顺序
+    hosts = iter(hosts)
+    exhausted = False
+
+    try:
+        while cancel is None or not cancel.is_set():
+            # 补充挂起的连接直到上限
+            while not exhausted and len(inflight) < max_sockets:
+                ip = next(hosts, None)
+                if ip is None:
+                    exhausted = True
+                    break
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.setblocking(False)
+                try:
+                    err = s.connect_ex((ip, int(port)))
+                except OSError:
+                    s.close()
+                    on_done(ip, False)
+                    continue
+                if err in _CONNECT_PENDING:
+                    sel.register(s, selectors.EVENT_WRITE, ip)
+                    inflight[s] = time.monotonic() + timeout
+                    continue
+                s.close()
+                on_done(ip, err == 0)
+                if err == 0:
+                    yield ip
+
+            if not inflight:
+                break
+
+            oldest = next(iter(inflight.values()))
+            ready = []
+            for key, _ in sel.select(max(0.0, oldest - time.monotonic())):
+                s = key.fileobj
+                is_open = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+                sel.unregister(s)
+                del inflight[s]
+                s.close()
+                on_done(key.data, is_open)
+                if is_open:
+                    ready.append(key.data)
+
+            # 关闭已超时的连接
+            now = time.monotonic()
+            for s, deadline in list(inflight.items()):
+                if deadline > now:
+                    break
+                ip = sel.get_key(s).data
+                sel.unregister(s)
+                del inflight[s]
+                s.close()
+                on_done(ip, False)
+
+            yield from ready
+    finally:
+        for s in inflight:
+            s.close()
+        sel.close()
+
+
+def identity_matcher(target, timeout=3):
+    """
+    返回按 MAC 或序列号识别设备的 match 协程函数，供 Scanner.scan 使用。
+    target 能解析为 MAC 时同时按 MAC 和序列号比较，否则只比较序列号。
+    不匹配的设备会立即从连接池中移除，不占用连接。
+    """
+    mac = Ck.normalize_mac(target)
+    serial = target.strip().upper()
+
+    async def match(ip, port):
+        info = await adb_async.device_info(ip, port, timeout)
+        if info and ((mac and Ck.normalize_mac(info['mac']) == mac) or info['serial'].upper() == serial):
+            return True
+        await adb_async.pool.evict(ip, port)
+        return False
+    return match
+
+
+class Scanner:
+    """
+    两阶段扫描引擎。
+    第一阶段用 iter_sweep 对整个地址范围做非阻塞端口探测；
+    第二阶段只对接受连接的主机做 ADB 握手，握手协程在共享的事件循环中执行，
+    同一时刻最多 max_workers 个握手在进行，待提交的任务按窗口逐步投递。
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, port=ADB_PORT, timeout=0.5,
+                 sweep_timeout=DEFAULT_SWEEP_TIMEOUT, max_sockets=DEFAULT_MAX_SOCKETS):
+        self.max_workers = max(1, int(max_workers))
+        self.port = port
+        self.timeout = timeout
+        self.sweep_timeout = sweep_timeout
+        self.max_sockets = max_sockets
+        self._active = 0
+        # 最近一次扫描中每个设备的握手耗时 (秒)
+        self.latencies = {}
+
+    def scan(self, hosts, on_found=None, on_progress=None, match=None, limit=None, cancel=None):
+        """
+        扫描给定的主机列表。两个阶段流水进行：端口探测一发现开放主机就开始握手。
+        on_found: 每发现一个设备时回调，参数为 'ip:port' 字符串（在调用线程中执行）。
+        on_progress(ip, is_open): 第一阶段每个地址探测结束时回调。
+        match: 可选的协程函数 match(ip, port)，代替单纯的握手检查，返回 True 才算找到
+               (例如 identity_matcher 按 MAC/序列号查找)。
+        limit: 找到这么多设备后立即结束：剩余地址不再探测，进行中的握手被取消。
+        cancel: 可选的 threading.Event (取消令牌)，被设置后同样立即结束，
+                socket 和握手协程在一个探测超时内全部释放。
+        返回: (设备列表, ScanStats)
+        """
+        stats = ScanStats(self.max_workers)
+        found = []
+        started = time.monotonic()
+        self._active = 0
+        self.latencies = {}
+        engine = get_engine()
+        queued = deque()
+        pending = {}
+
+        def progress(ip, is_open):
+            stats.hosts_probed += 1
+            if on_progress is not None:
+                on_progress(ip, is_open)
+
+        def dispatch():
+            # 按窗口投递协程，在途握手数不超过 max_workers
+            while queued and len(pending) < self.max_workers:
+                ip = queued.popleft()
+                pending[engine.submit(self._probe(ip, stats, match))] = ip
+
+        def collect(timeout):
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if enough():
+                    break # 同时完成的多余结果丢弃
+                ip = pending.pop(future)
+                if future.result():
+                    device_str = f"{ip}:{self.port}"
+                    found.append(device_str)
+                    if on_found is not None:
+                        on_found(device_str)
+
+        def enough():
+            return (limit is not None and len(found) >= limit) or (cancel is not None and cancel.is_set())
+
+        sweep = iter_sweep(hosts, self.port, self.sweep_timeout, self.max_sockets, progress, cancel)
+        swept = False
+        try:
+            # 第一阶段：端口探测，开放的主机立即进入握手队列
+            for ip in sweep:
+                stats.ports_open += 1
+                queued.append(ip)
+                dispatch()
+                collect(0)
+                if enough():
+                    break
+            else:
+                swept = cancel is None or not cancel.is_set()
+            stats.sweep_elapsed = time.monotonic() - started
+
+            # 第二阶段：等待剩余的握手
+            while (queued or pending) and not enough():
+                dispatch()
+                collect(CANCEL_POLL if cancel is not None else None)
+            stats.stopped_early = not swept or bool(queued or pending)
+            stats.cancelled = cancel is not None and cancel.is_set()
+        finally:
+            sweep.close()
+            for future in pending:
+                future.cancel()
+
+        stats.devices_found = len(found)
+        stats.elapsed = time.monotonic() - started
+        return found, stats
+
+    async def _probe(self, ip, stats, match=None):
+        """在事件循环中执行的单个握手，同时记录并发数（只在循环线程中修改，无需加锁）。"""
+        self._active += 1
+        stats.handshakes += 1
+        if self._active > stats.peak_concurrency:
+            stats.peak_concurrency = self._active
+        started = time.monotonic()
+        try:
+            if match is not None:
+                found = await match(ip, self.port)
+            else:
+                found = await adb_async.check_adb_device(ip, self.port, self.timeout)
+            if found:
+                self.latencies[ip] = time.monotonic() - started
+            return found
+        finally:
+            self._active -= 1
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 串码 (SN) 生成：按型号选择模板和前缀，已发放的 SN/MAC 记录在本地 SQLite 索引中，重复分配直接拒绝。
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import CheckInput as Ck # 导入 CheckInput.py 模块
+
+SN_CONFIG_FILE = 'sngen.json'
+SN_INDEX_FILE = 'serials.db'
+
+# 未配置型号时使用的前缀和模板 (即原来 main.py 中的 sn_head + 12 位 MAC)
+DEFAULT_PREFIX = "00570300004221C02117"
+DEFAULT_TEMPLATE = "{prefix}{mac}"
+
+# 配置中的默认项名称
+DEFAULT_MODEL = "default"
+
+
+class SnTemplate:
+    """
+    一个型号的串码模板。
+    template 可使用 {prefix}、{mac} (12 位大写 MAC) 和 {seq} (该前缀下的流水号，如 {seq:06d})。
+    """
+
+    __slots__ = ('model', 'prefix', 'template')
+
+    def __init__(self, model, prefix=DEFAULT_PREFIX, template=DEFAULT_TEMPLATE):
+        self.model = model
+        self.prefix = prefix
+        self.template = template
+
+    @property
+    def sequential(self):
+        """模板是否使用流水号 (SN 不能只由 MAC 推出)"""
+        return "{seq" in self.template
+
+    def render(self, mac, seq=0):
+        return self.template.format(prefix=self.prefix, mac=mac.hex, seq=seq)
+
+
+class SnRegistry:
+    """
+    型号 -> 串码模板。配置文件格式：
+    {"default": {"prefix": "...", "template": "{prefix}{mac}"}, "E900V22C": {...}}
+    未配置的型号使用 default。
+    """
+
+    def __init__(self):
+        self._templates = {DEFAULT_MODEL: SnTemplate(DEFAULT_MODEL)}
+
+    @classmethod
+    def load(cls, path=SN_CONFIG_FILE):
+        """读取配置文件；文件不存在时只有默认模板。"""
+        registry = cls()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf8') as f:
+                for model, entry in json.loads(f.read()).items():
+                    registry.register(model, entry.get('prefix', DEFAULT_PREFIX),
+                                      entry.get('template', DEFAULT_TEMPLATE))
+        return registry
+
+    def register(self, model, prefix, template=DEFAULT_TEMPLATE):
+        self._templates[model] = SnTemplate(model, prefix, template)
+
+    def for_model(self, model=None):
+        return self._templates.get(model or DEFAULT_MODEL) or self._templates[DEFAULT_MODEL]
+
+    def models(self):
+        return list(self._templates)
+
+
+class SnIndex:
+    """
+    已发放 SN 的持久索引 (SQLite)。SN 为主键、MAC 唯一，查重走索引，
+    历史记录达到百万级也只需一次索引查找。可在多个线程中使用。
+    confirmed 为 0 的记录只是预留 (尚未写入设备)，写入成功后确认，失败时撤销。
+    """
+
+    def __init__(self, path=SN_INDEX_FILE):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS issued (sn TEXT PRIMARY KEY, mac INTEGER NOT NULL UNIQUE, "
+                "model TEXT, account TEXT, issued_at REAL, confirmed INTEGER NOT NULL DEFAULT 1)"
+            )
+            # 旧版本的索引没有 confirmed 列，其中的记录都已写入设备
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(issued)")]
+            if 'confirmed' not in columns:
+                self._conn.execute("ALTER TABLE issued ADD COLUMN confirmed INTEGER NOT NULL DEFAULT 1")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS prefixes (prefix TEXT PRIMARY KEY, next_seq INTEGER NOT NULL)")
+
+    def _query(self, sql, params=()):
+        """在锁内执行一条查询并取第一行 (连接在多个线程间共享，读取也要加锁)。"""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def sn_of(self, mac):
+        """MAC 已分配的 SN，没有返回 None。"""
+        row = self._query("SELECT sn FROM issued WHERE mac = ?", (mac.value,))
+        return row[0] if row else None
+
+    def mac_of(self, sn):
+        """SN 已分配给的 MAC (Mac)，没有返回 None。"""
+        row = self._query("SELECT mac FROM issued WHERE sn = ?", (sn,))
+        return Ck.Mac(row[0]) if row else None
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM issued")[0]
+
+    def reserve(self, mac, template, account=""):
+        """
+        按 template 为 mac (Mac，格式不正确时为 None) 预留 SN。
+        同一 MAC 再次预留 (例如失败后重试) 时返回已登记的 SN；
+        未确认的预留与 template 不符 (例如当时尚未识别型号) 时改按 template 重新预留。
+        返回: (SN, 错误说明)，成功时错误说明为空，失败时 SN 为 None。
+        """
+        return self.reserve_batch([(mac, template, account)])[0]
+
+    def reserve_batch(self, items):
+        """
+        在一个事务中为整批预留 SN，任一项冲突 (包括批内 MAC 或 SN 重复) 时整批回滚。
+        items: [(mac, template, account), ...]，每项按自己的模板 (型号) 预留。
+        返回: [(SN, 错误说明), ...]，顺序与 items 相同；
+              回滚时冲突的项带错误说明，其余项为 (None, "")，均未登记。
+        """
+        results = []
+        batch = {} # 本批已预留的 MAC 整数值 -> 序号
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for i, (mac, template, account) in enumerate(items):
+                    first = batch.setdefault(mac.value, i) if mac is not None else i
+                    if first != i:
+                        results.append((None, f"MAC与本批第 {first + 1} 项重复"))
+                    else:
+                        results.append(self._reserve_one(template, mac, account))
+                if all(sn for sn, _ in results):
+                    self._conn.execute("COMMIT")
+                    return results
+                self._conn.execute("ROLLBACK")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(None, error) for _, error in results]
+
+    def _reserve_one(self, template, mac, account):
+        """在当前事务中预留一个 SN (调用方持有锁)。"""
+        conn = self._conn
+        if mac is None:
+            return None, "MAC地址格式不正确"
+
+        # 已登记过的 MAC：同一模板下视为重新分配，返回原 SN
+        row = conn.execute("SELECT sn, confirmed FROM issued WHERE mac = ?", (mac.value,)).fetchone()
+        if row is not None:
+            existing, confirmed = row
+            if template.sequential and existing.startswith(template.prefix):
+                return existing, ""
+            if not template.sequential and existing == template.render(mac):
+                return existing, ""
+            if confirmed:
+                return None, f"MAC已分配串码 {existing}"
+            # 未写入设备的预留按当前模板重新分配
+            conn.execute("DELETE FROM issued WHERE sn = ?", (existing,))
+
+        if template.sequential:
+            row = conn.execute("SELECT next_seq FROM prefixes WHERE prefix = ?", (template.prefix,)).fetchone()
+            seq = row[0] if row else 1
+            conn.execute("INSERT OR REPLACE INTO prefixes (prefix, next_seq) VALUES (?, ?)", (template.prefix, seq + 1))
+            sn = template.render(mac, seq)
+        else:
+            sn = template.render(mac)
+
+        owner = conn.execute("SELECT mac FROM issued WHERE sn = ?", (sn,)).fetchone()
+        if owner is not None:
+            return None, f"串码 {sn} 已分配给 {Ck.Mac(owner[0])}"
+
+        conn.execute("INSERT INTO issued (sn, mac, model, account, issued_at, confirmed) VALUES (?, ?, ?, ?, ?, 0)",
+                     (sn, mac.value, template.model, account, time.time()))
+        return sn, ""
+
+    def confirm(self, sn):
+        """SN 已写入设备，确认分配。"""
+        with self._lock:
+            self._conn.execute("UPDATE issued SET confirmed = 1 WHERE sn = ?", (sn,))
+
+    def release(self, sn):
+        """
+        撤销未确认的预留，MAC 之后可按当时的模板重新分配。
+        流水号不回退，撤销的 SN 不会再发给其它 MAC。已确认的记录不受影响。
+        返回: 是否撤销了预留。
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM issued WHERE sn = ? AND confirmed = 0", (sn,))
+        return cursor.rowcount > 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SnGenerator:
+    """按型号模板生成 SN，并在索引中登记，保证同一 SN 和同一 MAC 只发放一次。"""
+
+    def __init__(self, registry, index):
+        self.registry = registry
+        self.index = index
+
+    def preview(self, mac, model=None):
+        """只计算不登记：由 MAC 推出的 SN；使用流水号的模板返回 None。"""
+        template = self.registry.for_model(model)
+        mac = Ck.Mac.parse(mac)
+        if mac is None or template.sequential:
+            return None
+        return template.render(mac)
+
+    def allocate(self, mac, model=None, account=""):
+        """
+        为一个 MAC 按型号模板预留 SN 并登记 (见 SnIndex.reserve)，写入设备后调用 confirm (成功) 或 release (失败)。
+        返回: (SN, 错误说明)，成功时错误说明为空，失败时 SN 为 None。
+        """
+        return self.index.reserve(Ck.Mac.parse(mac), self.registry.for_model(model), account)
+
+    def allocate_batch(self, items):
+        """
+        在一个事务中为整批 MAC 预留 SN，任一项冲突时整批都不登记 (见 SnIndex.reserve_batch)。
+        items: [(mac, model, account), ...]，每项按自己的型号选择模板。
+        返回: [(SN, 错误说明), ...]，顺序与 items 相同。
+        """
+        return self.index.reserve_batch([(Ck.Mac.parse(mac), self.registry.for_model(model), account)
+                                         for mac, model, account in items])
+
+    def confirm(self, sn):
+        """SN 已写入设备，确认分配。"""
+        self.index.confirm(sn)
+
+    def release(self, sn):
+        """写入设备失败，撤销未确认的预留 (见 SnIndex.release)，返回是否撤销了预留。"""
+        return self.index.release(sn)
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    """获取进程内共享的 SnGenerator (首次调用时读取配置并打开索引)。"""
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = SnGenerator(SnRegistry.load(), SnIndex())
+        return _generator
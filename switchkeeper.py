@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 交换机会话保持：登录一次后保持 Telnet 会话，定时发送空行防止空闲超时，断开后才重新登录，
+# 切换 VLAN 只需命令本身的时间。界面和命令行共用同一个实例。
+
+import time
+import asyncio
+import threading
+
+import consoleswitch as cs # 导入 consoleswitch.py 模块
+from aioengine import get_engine # 导入共享的异步引擎
+
+CONFIG_FILE = cs.CONFIG_FILE
+
+# 发送保活空行的间隔 (秒)，需小于交换机 VTY 的空闲超时 (华为默认 10 分钟)
+KEEPALIVE_INTERVAL = 60
+
+
+class SwitchSession:
+    """
+    一台交换机的常驻会话。切换和保活都在 lock 下进行，同一时刻会话上只有一条命令序列。
+    切换结束后会话停在用户视图，下一次切换直接发送命令；连接断开时才重新登录。
+    """
+
+    __slots__ = ('config', 'telnet', 'lock', 'logins', '_keepalive')
+
+    def __init__(self, config):
+        self.config = config
+        self.telnet = None
+        self.lock = asyncio.Lock()
+        # 登录次数 (首次登录加上断开后的重新登录)
+        self.logins = 0
+        self._keepalive = None
+
+    @property
+    def host(self):
+        return self.config['host_ip']
+
+    @property
+    def connected(self):
+        return self.telnet is not None and self.telnet.tn is not None and not self.telnet.tn.eof
+
+    async def _login(self, timeout=3):
+        """建立连接并登录。返回: (是否成功, 是否连接上)"""
+        await self._drop()
+        telnet = cs.TelnetLib()
+        if not await telnet.link_async(self.host, int(self.config.get('port', 23)), timeout):
+            return False, False
+        if not await telnet.login_async(self.config['username'], self.config['password']):
+            await telnet.exit_async()
+            return False, True
+        self.telnet = telnet
+        self.logins += 1
+        return True, True
+
+    async def _drop(self):
+        if self.telnet is not None:
+            telnet, self.telnet = self.telnet, None
+            await telnet.exit_async()
+
+    async def connect(self):
+        """未连接时登录，返回是否已登录。"""
+        async with self.lock:
+            if not self.connected:
+                await self._login()
+            return self.connected
+
+    async def toggle(self, vid):
+        """把端口切换到 vid，返回 SwitchResult (不抛出异常)。"""
+        logger = cs.LogConfig.getlogger()
+        started = time.monotonic()
+        result = cs.SwitchResult(self.host, vid)
+        async with self.lock:
+            # 复用的会话可能已被交换机断开而本端尚未察觉，此时重新登录后再试一次
+            for retry in (True, False):
+                reused = self.connected
+                if not reused:
+                    logged_in, result.connected = await self._login()
+                    if not logged_in:
+                        result.message = '登录失败' if result.connected else '连接失败'
+                        break
+                try:
+                    await cs.switch_vlan_async(self.telnet, vid, cs.port_ranges(self.config))
+                    result.success = True
+                    break
+                except cs.SwitchError as e:
+                    if not self.connected:
+                        await self._drop()
+                        if reused and retry:
+                            logger.warning(f'[{self.host}] session dropped, logging in again')
+                            continue
+                    else:
+                        await self._resync()
+                    logger.error(f"[{self.host}] Telnet command sequence failed: {e}")
+                    result.message = f'执行 Telnet 命令序列时发生错误: {e}'
+                    break
+        result.elapsed = time.monotonic() - started
+        return result
+
+    async def _resync(self):
+        """命令出错后回到用户视图，回不去则断开 (下次使用时重新登录)"""
+        try:
+            await self.telnet.shell_async('return', check=False)
+        except cs.SwitchError:
+            await self._drop()
+
+    async def keepalive(self, interval=KEEPALIVE_INTERVAL):
+        """每隔 interval 秒发送一个空行；会话已断开时重新登录。"""
+        logger = cs.LogConfig.getlogger()
+        while True:
+            await asyncio.sleep(interval)
+            async with self.lock:
+                # 任何异常 (例如套接字已断开时的 OSError、连接超时) 都只记录，保活继续进行
+                try:
+                    if self.connected:
+                        try:
+                            await self.telnet.shell_async('', check=False)
+                            continue
+                        except cs.SwitchError as e:
+                            logger.warning(f'[{self.host}] keepalive failed: {e}')
+                            await self._drop()
+                    logger.info(f'[{self.host}] session dropped, logging in again')
+                    await self._login()
+                except Exception as e:
+                    logger.error(f'[{self.host}] keepalive error: {e!r}')
+                    await self._drop()
+
+    def start_keepalive(self, interval=KEEPALIVE_INTERVAL):
+        if interval and self._keepalive is None:
+            self._keepalive = asyncio.ensure_future(self.keepalive(interval))
+
+    async def close(self):
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            self._keepalive = None
+        async with self.lock:
+            await self._drop()
+
+
+class SwitchKeeper:
+    """
+    配置文件中全部交换机的常驻会话。协程方法在共享事件循环中执行，
+    同名的同步方法 (start/toggle/close) 可在任意其它线程中调用。
+    keepalive: 保活间隔 (秒)，为 0 时不保活 (例如只切换一次的命令行)。
+    """
+
+    def __init__(self, path=CONFIG_FILE, keepalive=KEEPALIVE_INTERVAL, max_parallel=cs.MAX_PARALLEL_SWITCHES):
+        self.path = path
+        self.keepalive = keepalive
+        self.max_parallel = max_parallel
+        self.switches = None
+        self.sessions = []
+        self._lock = None
+        self._slots = None
+
+    async def start_async(self):
+        """读取配置并同时登录所有交换机，返回已登录的台数；配置错误时抛出异常 (见 consoleswitch.load_switches)。"""
+        if self.switches is None:
+            self.switches = cs.load_switches(self.path)
+            self.sessions = [SwitchSession(config) for config in self.switches]
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(max(1, self.max_parallel))
+        connected = await asyncio.gather(*(self._limited(session.connect()) for session in self.sessions))
+        for session in self.sessions:
+            session.start_keepalive(self.keepalive)
+        return sum(connected)
+
+    async def _limited(self, coro):
+        async with self._slots:
+            return await coro
+
+    async def toggle_async(self, to_ottx=None):
+        """
+        同时切换所有交换机 (方向见 consoleswitch.toggle_targets)，成功的交换机记录下一次的 VLAN 并写回配置文件。
+        返回: [SwitchResult, ...]，顺序与配置文件相同。
+        """
+        if self.switches is None:
+            await self.start_async()
+        async with self._lock:
+            to_ottx, targets = cs.toggle_targets(self.switches, to_ottx)
+            results = await asyncio.gather(*(self._limited(session.toggle(vid))
+                                             for session, vid in zip(self.sessions, targets)))
+            cs.record_results(self.switches, results, to_ottx)
+            cs.save_switches(self.switches, self.path)
+            return results
+
+    async def close_async(self):
+        """退出所有会话并停止保活"""
+        await asyncio.gather(*(session.close() for session in self.sessions))
+
+    def start(self):
+        return get_engine().run(self.start_async())
+
+    def toggle(self, to_ottx=None):
+        return get_engine().run(self.toggle_async(to_ottx))
+
+    def close(self):
+        get_engine().run(self.close_async())
+
+
+_keeper = None
+_keeper_lock = threading.Lock()
+
+
+def get_keeper():
+    """获取进程内共享的 SwitchKeeper (首次调用时创建，首次切换时登录)。"""
+    global _keeper
+    with _keeper_lock:
+        if _keeper is None:
+            _keeper = SwitchKeeper()
+        return _keeper
+
+
+async def close_keeper():
+    """退出共享 SwitchKeeper 的所有会话 (未创建时什么也不做)。"""
+    if _keeper is not None:
+        await _keeper.close_async()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# atelnet.TelnetClient 与 consoleswitch.TelnetLib 的测试：对本机启动的模拟华为 VTY 服务器进行登录、协商和批量命令。
+
+import os
+import re
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import atelnet # noqa: E402
+import consoleswitch as cs # noqa: E402
+from atelnet import IAC, DO, DONT, WILL, WONT, SB, SE, ECHO, SGA # noqa: E402
+
+TTYPE = 24
+NAWS = 31
+# 服务端读取命令行时去掉客户端的协商回应
+_NEGOTIATION_RE = re.compile(rb'\xff[\xfb-\xfe].')
+
+
+class FakeVty:
+    """
+    模拟华为交换机 VTY：登录时先发送 IAC WILL ECHO / WILL SGA，
+    之后按视图回应 system-view、vlan、port-group、quit、return，含 bad 的命令返回 Error:。
+    """
+
+    def __init__(self, password='pw'):
+        self.password = password
+        self.commands = []
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        async def line():
+            data = await reader.readuntil(b'\n')
+            return _NEGOTIATION_RE.sub(b'', data).decode().strip()
+
+        try:
+            writer.write(bytes([IAC, WILL, ECHO, IAC, WILL, SGA]) + b'\r\nLogin authentication\r\n\r\nUsername:')
+            while True:
+                await line()
+                writer.write(b'Password:')
+                if await line() == self.password:
+                    break
+                writer.write(b'\r\nError: Local authentication is rejected.\r\n\r\nUsername:')
+            writer.write(b'\r\nInfo: The max number of VTY users is 5.\r\n<HUAWEI>')
+            view, stack = '<HUAWEI>', []
+            while True:
+                command = await line()
+                self.commands.append(command)
+                out = command + '\r\n'
+                if command == 'system-view' and view == '<HUAWEI>':
+                    stack.append(view)
+                    view = '[HUAWEI]'
+                    out += 'Enter system view, return user view with Ctrl+Z.\r\n'
+                elif command.startswith('vlan ') or command.startswith('port-group '):
+                    stack.append(view)
+                    name = command.replace('port-group ', 'port-group-').replace('vlan ', 'vlan')
+                    view = f'[HUAWEI-{name}]'
+                elif 'bad' in command:
+                    out += "                  ^\r\nError: Wrong parameter found at '^' position.\r\n"
+                elif command == 'display lines':
+                    out += 'line1\r\nline2 [OK]\r\n'
+                elif command == 'return':
+                    view, stack = '<HUAWEI>', []
+                elif command == 'quit':
+                    if not stack:
+                        break
+                    view = stack.pop()
+                writer.write((out + view).encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class ScriptedServer:
+    """按顺序发送给定的数据块 (每块之间稍作停顿，使客户端分多次读取)，记录客户端发来的数据。"""
+
+    def __init__(self, chunks, close=False):
+        self.chunks = chunks
+        self.close = close
+        self.received = bytearray()
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        for chunk in self.chunks:
+            writer.write(chunk)
+            await writer.drain()
+            await asyncio.sleep(0.05)
+        if self.close:
+            writer.close()
+            return
+        try:
+            while True:
+                data = await reader.read(100)
+                if not data:
+                    break
+                self.received += data
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+class TelnetClientTest(unittest.IsolatedAsyncioTestCase):
+
+    async def _client(self, chunks, close=False):
+        server = await ScriptedServer(chunks, close).start()
+        self.addAsyncCleanup(server.stop)
+        client = atelnet.TelnetClient()
+        await client.open('127.0.0.1', server.port)
+        self.addAsyncCleanup(client.close)
+        return server, client
+
+    async def test_negotiation(self):
+        server, client = await self._client([
+            bytes([IAC, WILL, ECHO, IAC, WILL, SGA, IAC, DO, TTYPE, IAC, DO, SGA]),
+            bytes([IAC, WILL, ECHO]) + b'login:',
+        ])
+        index, match, data = await client.expect([re.compile(b'login:')], 2)
+        self.assertEqual((index, data), (0, b'login:'))
+        await asyncio.sleep(0.1)
+        # 接受回显和抑制继续，拒绝终端类型；重复的 WILL ECHO 不再回应
+        self.assertEqual(bytes(server.received),
+                         bytes([IAC, DO, ECHO, IAC, DO, SGA, IAC, WONT, TTYPE, IAC, WILL, SGA]))
+
+    async def test_refuse_unknown_remote_option(self):
+        server, client = await self._client([bytes([IAC, WILL, NAWS, IAC, DONT, ECHO]) + b'>'])
+        await client.expect([re.compile(b'>')], 2)
+        await asyncio.sleep(0.1)
+        self.assertEqual(bytes(server.received), bytes([IAC, DONT, NAWS, IAC, WONT, ECHO]))
+
+    async def test_split_iac_sequence(self):
+        server, client = await self._client([b'ab' + bytes([IAC]), bytes([WILL]), bytes([ECHO]) + b'cd' + bytes([IAC]),
+                                             bytes([IAC]) + b'\r\x00ef>'])
+        _, _, data = await client.expect([re.compile(b'>')], 2)
+        self.assertEqual(data, b'abcd\xff\ref>')
+        await asyncio.sleep(0.1)
+        self.assertEqual(bytes(server.received), bytes([IAC, DO, ECHO]))
+
+    async def test_subnegotiation_stripped(self):
+        _, client = await self._client([b'x' + bytes([IAC, SB, TTYPE]), bytes([1, IAC]), bytes([SE]) + b'y>'])
+        _, _, data = await client.expect([re.compile(b'>')], 2)
+        self.assertEqual(data, b'xy>')
+
+    async def test_write_escapes_iac(self):
+        server, client = await self._client([b'>'])
+        await client.write(b'a\xffb')
+        await asyncio.sleep(0.1)
+        self.assertEqual(bytes(server.received), b'a\xff\xffb')
+
+    async def test_expect_timeout_returns_partial_data(self):
+        _, client = await self._client([b'partial'])
+        index, match, data = await client.expect([re.compile(b'never')], 0.3)
+        self.assertEqual((index, match, data), (-1, None, b'partial'))
+
+    async def test_expect_eof(self):
+        _, client = await self._client([b'bye'], close=True)
+        # 连接关闭前收到的数据先返回，之后抛出 EOFError
+        self.assertEqual(await client.expect([re.compile(b'never')], 2), (-1, None, b'bye'))
+        with self.assertRaises(EOFError):
+            await client.expect([re.compile(b'never')], 2)
+
+    async def test_read_until(self):
+        _, client = await self._client([b'Login\r\nUser', b'name:'])
+        self.assertEqual(await client.read_until(b'Username:', 2), b'Login\r\nUsername:')
+
+
+class TelnetLibTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.vty = await FakeVty().start()
+        self.telnet = cs.TelnetLib()
+        self.assertTrue(await self.telnet.link_async('127.0.0.1', self.vty.port))
+
+    async def asyncTearDown(self):
+        await self.telnet.exit_async()
+        await self.vty.stop()
+
+    async def test_login_success(self):
+        self.assertTrue(await self.telnet.login_async('admin', 'pw'))
+        self.assertEqual(self.telnet.prompt, '<HUAWEI>')
+        # 登录后关闭分页
+        self.assertEqual(self.vty.commands, ['screen-length 0 temporary'])
+
+    async def test_login_failure(self):
+        self.assertFalse(await self.telnet.login_async('admin', 'wrong', timeout=2))
+        self.assertEqual(self.vty.commands, [])
+
+    async def test_batch_splits_results(self):
+        await self.telnet.login_async('admin', 'pw')
+        results = await self.telnet.batch_async(['system-view', 'vlan 10', 'display lines', 'quit', 'port-group ottx'])
+        self.assertEqual(results, [
+            ('system-view', 'Enter system view, return user view with Ctrl+Z.'),
+            ('vlan 10', ''),
+            # 输出中的 [OK] 不是提示符
+            ('display lines', 'line1\nline2 [OK]'),
+            ('quit', ''),
+            ('port-group ottx', ''),
+        ])
+        self.assertEqual(self.telnet.prompt, '[HUAWEI-port-group-ottx]')
+
+    async def test_batch_error_reads_all_results(self):
+        await self.telnet.login_async('admin', 'pw')
+        with self.assertRaises(cs.SwitchError) as caught:
+            await self.telnet.batch_async(['system-view', 'port bad', 'vlan 20', 'quit'])
+        error = caught.exception
+        self.assertEqual(error.command, 'port bad')
+        self.assertEqual(error.failed, 1)
+        self.assertEqual([command for command, _ in error.results], ['system-view', 'port bad', 'vlan 20', 'quit'])
+        self.assertIn('Error:', error.results[1][1])
+        # 出错后其余命令的输出也已读完，会话仍然同步
+        self.assertEqual(self.telnet.prompt, '[HUAWEI]')
+        self.assertEqual(await self.telnet.shell_async('return'), '')
+        self.assertEqual(self.telnet.prompt, '<HUAWEI>')
+
+    async def test_shell_timeout(self):
+        await self.telnet.login_async('admin', 'pw')
+        # 没有发送命令时交换机不会再返回提示符，等待超时
+        with self.assertRaises(cs.SwitchError):
+            await self.telnet._read_prompt('nothing', 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# sngen 的测试：SQLite 索引中的 MAC/SN 查重，预留、确认、撤销，以及整批预留。
+
+import os
+import sys
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sngen # noqa: E402
+import CheckInput as Ck # noqa: E402
+
+MAC_A = "AA:BB:CC:00:00:01"
+MAC_B = "AA:BB:CC:00:00:02"
+MAC_C = "AA:BB:CC:00:00:03"
+
+
+class SnGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'serials.db')
+        self.registry = sngen.SnRegistry()
+        self.registry.register('SEQ', 'SKW', '{prefix}{seq:04d}')
+        # 与 MAC 无关的固定串码，用来制造 SN 冲突
+        self.registry.register('FIXED', 'SKW', '{prefix}FIXED')
+        self.index = sngen.SnIndex(self.path)
+        self.addCleanup(self.index.close)
+        self.generator = sngen.SnGenerator(self.registry, self.index)
+
+    def test_default_template(self):
+        sn, error = self.generator.allocate(MAC_A)
+        self.assertEqual((sn, error), (sngen.DEFAULT_PREFIX + "AABBCC000001", ""))
+        self.assertEqual(self.generator.preview(MAC_A), sn)
+        self.assertEqual(self.index.sn_of(Ck.Mac.parse(MAC_A)), sn)
+        self.assertEqual(self.index.mac_of(sn), Ck.Mac.parse(MAC_A))
+
+    def test_invalid_mac(self):
+        self.assertEqual(self.generator.allocate("not a mac"), (None, "MAC地址格式不正确"))
+        self.assertEqual(len(self.index), 0)
+
+    def test_same_mac_reuses_sn(self):
+        first, _ = self.generator.allocate(MAC_A, 'SEQ')
+        self.assertEqual(first, 'SKW0001')
+        self.assertEqual(self.generator.allocate(MAC_A, 'SEQ'), (first, ""))
+        self.assertEqual(self.generator.allocate(MAC_B, 'SEQ'), ('SKW0002', ""))
+
+    def test_confirmed_mac_rejected_under_other_template(self):
+        sn, _ = self.generator.allocate(MAC_A, 'SEQ')
+        self.generator.confirm(sn)
+        self.assertEqual(self.generator.allocate(MAC_A), (None, f"MAC已分配串码 {sn}"))
+
+    def test_unconfirmed_reservation_follows_new_template(self):
+        sn, _ = self.generator.allocate(MAC_A)
+        replaced, error = self.generator.allocate(MAC_A, 'SEQ')
+        self.assertEqual((replaced, error), ('SKW0001', ""))
+        self.assertIsNone(self.index.mac_of(sn))
+        self.assertEqual(len(self.index), 1)
+
+    def test_duplicate_sn_rejected(self):
+        sn, _ = self.generator.allocate(MAC_A, 'FIXED')
+        self.assertEqual(self.generator.allocate(MAC_B, 'FIXED'), (None, f"串码 {sn} 已分配给 {Ck.Mac.parse(MAC_A)}"))
+        self.assertIsNone(self.index.sn_of(Ck.Mac.parse(MAC_B)))
+
+    def test_release_unconfirmed(self):
+        sn, _ = self.generator.allocate(MAC_A, 'SEQ')
+        self.assertTrue(self.generator.release(sn))
+        self.assertIsNone(self.index.mac_of(sn))
+        # 流水号不回退，撤销的 SN 不会再发出
+        self.assertEqual(self.generator.allocate(MAC_B, 'SEQ'), ('SKW0002', ""))
+
+    def test_release_keeps_confirmed(self):
+        sn, _ = self.generator.allocate(MAC_A)
+        self.generator.confirm(sn)
+        self.assertFalse(self.generator.release(sn))
+        self.assertEqual(self.index.mac_of(sn), Ck.Mac.parse(MAC_A))
+
+    def test_reopen_keeps_index(self):
+        sn, _ = self.generator.allocate(MAC_A, 'SEQ')
+        self.generator.confirm(sn)
+        self.index.close()
+        index = sngen.SnIndex(self.path)
+        self.addCleanup(index.close)
+        generator = sngen.SnGenerator(self.registry, index)
+        self.assertEqual(generator.allocate(MAC_B, 'SEQ'), ('SKW0002', ""))
+        self.assertEqual(generator.allocate(MAC_A), (None, f"MAC已分配串码 {sn}"))
+
+    def test_migrates_index_without_confirmed_column(self):
+        self.index.close()
+        os.remove(self.path)
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE issued (sn TEXT PRIMARY KEY, mac INTEGER NOT NULL UNIQUE, "
+                     "model TEXT, account TEXT, issued_at REAL)")
+        conn.execute("INSERT INTO issued VALUES ('OLD', ?, 'default', '', 0)", (Ck.Mac.parse(MAC_A).value,))
+        conn.commit()
+        conn.close()
+        index = sngen.SnIndex(self.path)
+        self.addCleanup(index.close)
+        # 旧记录视为已确认
+        self.assertFalse(index.release('OLD'))
+        self.assertEqual(index.mac_of('OLD'), Ck.Mac.parse(MAC_A))
+
+    def test_batch_uses_each_model(self):
+        results = self.generator.allocate_batch([(MAC_A, 'SEQ', 'a'), (MAC_B, None, 'b'), (MAC_C, 'SEQ', 'c')])
+        self.assertEqual(results, [('SKW0001', ""), (sngen.DEFAULT_PREFIX + "AABBCC000002", ""), ('SKW0002', "")])
+        self.assertEqual(len(self.index), 3)
+
+    def test_batch_rolls_back_on_collision(self):
+        sn, _ = self.generator.allocate(MAC_C, 'FIXED')
+        results = self.generator.allocate_batch([(MAC_A, 'SEQ', ''), (MAC_B, 'FIXED', '')])
+        self.assertEqual(results, [(None, ""), (None, f"串码 {sn} 已分配给 {Ck.Mac.parse(MAC_C)}")])
+        # 整批未登记，流水号也未消耗
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.generator.allocate(MAC_A, 'SEQ'), ('SKW0001', ""))
+
+    def test_batch_rejects_duplicates_within_batch(self):
+        results = self.generator.allocate_batch([(MAC_A, None, ''), (MAC_B, 'FIXED', ''),
+                                                 (MAC_A.lower(), None, ''), (MAC_C, 'FIXED', '')])
+        self.assertEqual(results, [(None, ""), (None, ""), (None, "MAC与本批第 1 项重复"),
+                                   (None, f"串码 SKWFIXED 已分配给 {Ck.Mac.parse(MAC_B)}")])
+        self.assertEqual(len(self.index), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# cython:language_level=3
+# -*- coding: utf-8 -*-
+# @copyright: John Chen
+# 不依赖 Qt 的业务流程：单台设备的完整修改流程、单独重启，以及切换交换机 VLAN。
+# 日志通过 log 回调输出，由调用方决定显示在界面还是控制台。
+
+import time
+
+import function # 导入 function.py 模块
+import fingerprint # 导入 fingerprint.py 模块
+import sngen # 导入 sngen.py 模块
+import switchkeeper # 导入 switchkeeper.py 模块
+import CheckInput as Ck # 导入 CheckInput.py 模块
+
+ADB_PORT = function.ADB_PORT
+
+# 恢复出厂后等待设备重新就绪的最长时间 (秒)
+RECOVERY_DEADLINE = function.READY_DEADLINE
+
+
+def _cancelled(cancel, log):
+    """检查是否已被取消，已取消时输出日志。"""
+    if cancel is not None and cancel.is_set():
+        log("任务已取消。")
+        return True
+    return False
+
+
+async def precheck(ip, log, port=ADB_PORT, manufacturer=fingerprint.SKYWORTH):
+    """
+    修改前的设备检查：ADB 可连接且厂商正确 (读取一次设备指纹，结果留在缓存中供后续步骤使用)。
+    在事件循环中执行，不占用修改队列的名额，因此可以与其它设备的修改同时进行。
+    返回: 检查通过则 True，否则 False。
+    """
+    device = await fingerprint.cache.get_async(ip, port)
+    if device is None:
+        log("请检查机顶盒 ADB 调试是否打开。")
+        return False
+    log(f"已连接到: {ip}")
+
+    if not device.is_manufacturer(manufacturer):
+        log("厂商不正确，请检查是否为创维机顶盒。")
+        return False
+    log("厂家正确")
+    return True
+
+
+def allocate_sn(ip, mac, account, log, port=ADB_PORT, model=None):
+    """
+    为本次修改预留串码并登记到 SN 索引 (写入设备后由 _settle_sn 确认或撤销)。
+    未指定 model 时按设备指纹中的型号选择模板。
+    返回: SN，分配失败 (例如 MAC 或 SN 已发放给其它设备) 返回 None。
+    """
+    if model is None:
+        device = fingerprint.cache.get(ip, port)
+        model = device.model if device is not None else None
+    sn, error = sngen.get_generator().allocate(mac, model, account)
+    if sn is None:
+        log(f"串码分配失败: {error}")
+        return None
+    log(f"串码: {sn}")
+    return sn
+
+
+def _settle_sn(sn, written):
+    """串码已写入设备则确认分配，写入失败则撤销预留 (重试时可按当时的型号模板重新分配)。"""
+    generator = sngen.get_generator()
+    if written:
+        generator.confirm(sn)
+    else:
+        generator.release(sn)
+
+
+def core_program(ip, mac, account, is_recovering, is_resetting, log, port=ADB_PORT, cancel=None,
+                 recovery_deadline=RECOVERY_DEADLINE, model=None):
+    """
+    单台设备的核心修改流程。
+    mac: MAC 字符串或 CheckInput.Mac。
+    model: 选择串码模板的型号，为空时使用设备指纹中的型号 (见 sngen)。
+    cancel: 可选的 threading.Event (取消令牌)，被设置后在步骤之间停止，
+            等待和按键序列也会被提前打断。
+    recovery_deadline: 恢复出厂后等待设备就绪的最长时间 (秒)。
+    返回: 流程成功完成则 True，否则 False。
+    """
+    if _cancelled(cancel, log):
+        return False
+
+    # 只解析一次，之后各步骤传递 Mac
+    mac = Ck.Mac.parse(mac)
+    if mac is None:
+        log("MAC地址格式不正确。")
+        return False
+
+    sn = allocate_sn(ip, mac, account, log, port, model)
+    if sn is None:
+        return False
+
+    # 只修改 SN/账号 + 重启：MAC、SN、账号、密码一次往返全部写入
+    if is_resetting and not is_recovering:
+        return _provision_and_reboot(ip, mac, account, sn, log, port)
+
+    # 写入参数会使指纹缓存失效，OTTX 状态 (PPPoE 账号) 在写入前从前置检查读取的指纹中取得
+    device = fingerprint.cache.get(ip, port)
+    is_ottx = device is not None and device.ottx
+
+    # 2. 修改 MAC (只写 MAC 和 SN，不改变账号)
+    if not function.mac_change(mac, ip, port, sn):
+        log("MAC地址修改失败。尝试直接进行 SN/账号 修改...")
+        if not function.change_sn_account(ip, account, sn, port):
+            _settle_sn(sn, False)
+            log("修改失败，请重新尝试。")
+            return False
+        # 账号已写为 OTTX 账号
+        is_ottx = True
+    _settle_sn(sn, True)
+
+    log("Mac地址修改成功。")
+
+    # 3. 恢复出厂设置流程
+    if not is_recovering:
+        log("所有操作完成。未进行重启或恢复出厂。")
+        return True
+
+    if _cancelled(cancel, log):
+        return False
+
+    if not is_ottx:
+        log("设备未处于 OTTX 状态，无法恢复出厂。")
+        return False
+
+    log("开始恢复出厂设置...")
+    if not function.recovery(ip, port):
+        log("恢复失败，请重新尝试。")
+        return False
+
+    log(f"恢复出厂设置成功，等待设备重启和初始化 (最长 {recovery_deadline} 秒)...")
+    started = time.monotonic()
+    new_ip = function.wait_until_ready(mac, ip, port, recovery_deadline, cancel, log)
+    if _cancelled(cancel, log):
+        return False
+    if new_ip is None:
+        log("等待设备就绪超时。")
+        return False
+    log(f"设备已就绪 (IP: {new_ip})，用时 {time.monotonic() - started:.0f} 秒。")
+
+    if function.rec_auto_change(mac, account, port, ip=new_ip, cancel=cancel):
+        log("自动拨号成功。")
+        return True
+    if _cancelled(cancel, log):
+        return False
+    log("自动拨号失败。")
+    return False
+
+
+def _provision_and_reboot(ip, mac, account, sn, log, port):
+    results = function.provision(ip, mac, account, sn, port)
+    _settle_sn(sn, results is not None and any(key == "sn" and success for key, success, _ in results))
+    if results is None:
+        log("修改失败，请重新尝试。")
+        return False
+
+    failed = [key for key, success, _ in results if not success]
+    if "mac" in failed:
+        log("MAC地址修改失败。")
+        failed.remove("mac")
+    else:
+        log("Mac地址修改成功。")
+
+    if failed:
+        log(f"修改失败 ({', '.join(failed)})，请重新尝试。")
+        return False
+
+    log("串码/账号修改成功。")
+    if function.reboot(ip, port):
+        log("设备重启命令发送成功！")
+        return True
+    log("设备重启失败！")
+    return False
+
+
+def reboot_device(ip, log, port=ADB_PORT, cancel=None):
+    """单独重启设备，返回是否成功发送重启命令。"""
+    if not Ck.check_adb_status(ip, port):
+        log("请检查机顶盒 ADB 调试是否打开。")
+        return False
+
+    if _cancelled(cancel, log):
+        return False
+
+    log(f"已连接到: {ip}，正在执行重启...")
+    if function.reboot(ip, port):
+        log("设备重启命令发送成功！")
+        return True
+    log("设备重启失败！")
+    return False
+
+
+def toggle_vlan(log, to_ottx=None, keeper=None):
+    """
+    切换工作台所有交换机的 VLAN (使用常驻会话，已登录时不再重新登录)。
+    to_ottx: True 切到 OTTX VLAN，False 切到网络VLAN，None 按配置文件中记录的下一次方向。
+    keeper: SwitchKeeper，默认使用进程内共享的实例。
+    返回: 所有交换机都切换成功则 True，否则 False。
+    """
+    keeper = keeper or switchkeeper.get_keeper()
+    try:
+        results = keeper.toggle(to_ottx)
+    except (OSError, ValueError) as e:
+        log(f"读取交换机配置失败 ({keeper.path}): {e}")
+        return False
+    for result in results:
+        log(f"交换机 {result}")
+    return all(result.success for result in results)